@@ -1,22 +1,220 @@
 import streamlit as st
-from datetime import datetime
+import pandas as pd
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+from abc import ABC, abstractmethod
+import argparse
+import bisect
+import hashlib
 import json
+import shutil
 import sqlite3
 import os
+import re
+import sys
+import tempfile
+import threading
+import time
 import uuid
+import zipfile
+import zlib
+from PIL import Image, ImageOps
 
-# DB 초기화
-def init_db():
-    conn = sqlite3.connect('settlement.db')
-    c = conn.cursor()
+# 저장소 설정 - sqlite(기본, DB 파일) 또는 memory(메모리 + 주기적 디스크 기록)
+DB_PATH = os.environ.get('SETTLEMENT_DB_PATH', 'settlement.db')
+STORAGE_BACKEND = os.environ.get('SETTLEMENT_STORAGE', 'sqlite')
+MEMORY_SNAPSHOT_PATH = os.environ.get('SETTLEMENT_MEMORY_SNAPSHOT_PATH', 'settlement_memory.jsonl')
+MEMORY_SNAPSHOT_INTERVAL_SECONDS = float(os.environ.get('SETTLEMENT_MEMORY_SNAPSHOT_INTERVAL_SECONDS', '5'))
+MEMORY_COMPACT_MIN_ENTRIES = int(os.environ.get('SETTLEMENT_MEMORY_COMPACT_MIN_ENTRIES', '1000'))  # 변경 내역이 이보다 많고 현재 기록 수의 2배를 넘으면 압축
+
+# 장부(그룹) - 기존 데이터와 새로 만든 거래/정산은 별도 지정이 없으면 기본 장부에 속함
+DEFAULT_LEDGER_ID = 1
+DEFAULT_LEDGER_NAME = '기본 장부'
+
+# 첨부 사진 업로드 설정 (환경 변수로 변경 가능)
+ATTACHMENT_DIR = os.environ.get('SETTLEMENT_ATTACHMENT_DIR', 'attachments')
+UPLOAD_WORKERS = int(os.environ.get('SETTLEMENT_UPLOAD_WORKERS', '4'))
+UPLOAD_MAX_DIMENSION = int(os.environ.get('SETTLEMENT_UPLOAD_MAX_DIMENSION', '2048'))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_PROGRESS_REFRESH_SECONDS = 0.5  # 사진 처리 중 진행률 자동 갱신 주기
+
+# 첨부파일 정리(GC) 설정 - 유예 시간 이내에 수정된 파일은 업로드 중일 수 있으므로 건너뜀
+ATTACHMENT_GC_GRACE_HOURS = float(os.environ.get('SETTLEMENT_GC_GRACE_HOURS', '24'))
+ATTACHMENT_GC_INTERVAL_HOURS = float(os.environ.get('SETTLEMENT_GC_INTERVAL_HOURS', '24'))  # 0이면 자동 정리 안 함
+ATTACHMENT_GC_BATCH_SIZE = 500
+ATTACHMENT_GC_BATCHES_PER_RUN = int(os.environ.get('SETTLEMENT_GC_BATCHES_PER_RUN', '20'))  # 자동/버튼 정리 1회에 검사할 묶음 수
+ATTACHMENT_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# 이전 버전이 작업 폴더에 저장한 사진 이름 (settlement_<정산 이름>_<YYYYMMDD>_<uuid hex>.<확장자>)
+LEGACY_ATTACHMENT_PATTERN = re.compile(r'settlement_.+_\d{8}_[0-9a-f]{32}\.(png|jpe?g)', re.IGNORECASE)
+
+# 백업 설정 - 한 단계에 복사할 페이지 수만큼만 잠그고 단계 사이에 쉬어 쓰기 작업을 막지 않음
+BACKUP_DIR = os.environ.get('SETTLEMENT_BACKUP_DIR', 'backups')
+BACKUP_RETENTION = int(os.environ.get('SETTLEMENT_BACKUP_RETENTION', '7'))
+BACKUP_INTERVAL_HOURS = float(os.environ.get('SETTLEMENT_BACKUP_INTERVAL_HOURS', '0'))  # 0이면 자동 백업 안 함
+BACKUP_PAGES_PER_STEP = 64
+BACKUP_STEP_SLEEP = 0.005
+SNAPSHOT_FORMAT_VERSION = 2  # 2: 연도별 보관 DB 포함
+
+# 보관 설정 - 오래된 정산은 연도별 보관 DB(archive/settlement_YYYY.db)로 옮기고 필요할 때만 ATTACH
+ARCHIVE_DIR = os.environ.get('SETTLEMENT_ARCHIVE_DIR', 'archive')
+ARCHIVE_AFTER_DAYS = int(os.environ.get('SETTLEMENT_ARCHIVE_AFTER_DAYS', '365'))
+
+# 분석 테이블 집계 SQL ({source}: settlements 테이블 또는 NEW/OLD 행, {sign}: +1 추가 / -1 차감)
+# 멤버 x 월 지출은 거래 날짜 기준, 월별 정산 요약은 정산 날짜 기준으로 집계
+MEMBER_MONTHLY_UPSERT_SQL = '''
+    INSERT INTO member_monthly_spend (ledger_id, month, member, total_amount, settlement_count)
+    SELECT s.ledger_id, substr(json_extract(t.value, '$.date'), 1, 7) AS month, m.key AS member,
+           {sign} * SUM(json_extract(t.value, '$.amount')), {sign} * COUNT(DISTINCT s.id)
+    FROM {source} s, json_each(s.settlement_data) m, json_each(m.value, '$.transactions') t
+    WHERE 1
+    GROUP BY s.ledger_id, month, member
+    ON CONFLICT(ledger_id, month, member) DO UPDATE SET
+        total_amount = total_amount + excluded.total_amount,
+        settlement_count = settlement_count + excluded.settlement_count'''
+
+MONTHLY_SUMMARY_UPSERT_SQL = '''
+    INSERT INTO monthly_settlement_summary (ledger_id, month, settlement_count, total_amount)
+    SELECT s.ledger_id, substr(s.date, 1, 7) AS month, {sign} * COUNT(*), {sign} * SUM(s.total_amount)
+    FROM {source} s
+    WHERE 1
+    GROUP BY s.ledger_id, month
+    ON CONFLICT(ledger_id, month) DO UPDATE SET
+        settlement_count = settlement_count + excluded.settlement_count,
+        total_amount = total_amount + excluded.total_amount'''
+
+ANALYTICS_CLEANUP_SQL = '''
+    DELETE FROM member_monthly_spend WHERE settlement_count <= 0;
+    DELETE FROM monthly_settlement_summary WHERE settlement_count <= 0'''
+
+SETTLEMENT_COLUMNS = 'id, name, date, total_amount, member_count, settlement_data, created_at, image_path, ledger_id'
+
+def _analytics_sql(source, sign):
+    """주어진 정산 행 집합을 분석 테이블에 더하거나(sign=1) 빼는(sign=-1) SQL 목록"""
+    return [MEMBER_MONTHLY_UPSERT_SQL.format(source=source, sign=sign),
+            MONTHLY_SUMMARY_UPSERT_SQL.format(source=source, sign=sign)]
+
+def _trigger_row(alias):
+    """트리거 안에서 NEW/OLD 행을 settlements 테이블처럼 다루기 위한 서브쿼리"""
+    return (f"(SELECT {alias}.id AS id, {alias}.ledger_id AS ledger_id, {alias}.date AS date, "
+            f"{alias}.total_amount AS total_amount, {alias}.settlement_data AS settlement_data)")
+
+# 분석 테이블 및 동기화 트리거 생성 (다시 집계해야 하면 True 반환, has_archived: 보관 DB에 정산이 있는지)
+def init_analytics(c, has_archived=False):
+    # 장부 구분 전 형식의 분석 테이블은 새 형식으로 다시 만듦
+    c.execute("SELECT name FROM pragma_table_info('member_monthly_spend')")
+    columns = {row[0] for row in c.fetchall()}
+    migrated = bool(columns) and 'ledger_id' not in columns
+    if migrated:
+        for trigger in ('settlements_analytics_insert', 'settlements_analytics_delete', 'settlements_analytics_update'):
+            c.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        c.execute('DROP TABLE member_monthly_spend')
+        c.execute('DROP TABLE IF EXISTS monthly_settlement_summary')
     
-    # 거래 내역 테이블
-    c.execute('''CREATE TABLE IF NOT EXISTS transactions
-                 (id INTEGER PRIMARY KEY, date TEXT, description TEXT, 
-                  amount REAL, members TEXT, member_amounts TEXT, 
-                  created_at TEXT, updated_at TEXT)''')
+    # 장부 x 월 x 멤버별 지출 합계
+    c.execute('''CREATE TABLE IF NOT EXISTS member_monthly_spend
+                 (ledger_id INTEGER, month TEXT, member TEXT, total_amount REAL, settlement_count INTEGER,
+                  PRIMARY KEY (ledger_id, month, member))''')
     
-    # 정산 결과 테이블
+    # 장부 x 월별 정산 건수/금액 요약
+    c.execute('''CREATE TABLE IF NOT EXISTS monthly_settlement_summary
+                 (ledger_id INTEGER, month TEXT, settlement_count INTEGER, total_amount REAL,
+                  PRIMARY KEY (ledger_id, month))''')
+    
+    add_new = ";\n".join(_analytics_sql(_trigger_row('NEW'), 1))
+    remove_old = ";\n".join(_analytics_sql(_trigger_row('OLD'), -1))
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS settlements_analytics_insert
+                  AFTER INSERT ON settlements BEGIN {add_new}; END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS settlements_analytics_delete
+                  AFTER DELETE ON settlements BEGIN {remove_old}; {ANALYTICS_CLEANUP_SQL}; END''')
+    # 감시 컬럼 목록이 바뀌었을 수 있으므로 수정 트리거는 항상 다시 만듦
+    c.execute('DROP TRIGGER IF EXISTS settlements_analytics_update')
+    c.execute(f'''CREATE TRIGGER settlements_analytics_update
+                  AFTER UPDATE OF ledger_id, date, total_amount, settlement_data ON settlements
+                  BEGIN {remove_old}; {add_new}; {ANALYTICS_CLEANUP_SQL}; END''')
+    
+    # 형식을 바꿨거나, 운영/보관 DB에 정산 기록이 있는데 분석 테이블이 비어 있으면 백필 필요
+    c.execute('''SELECT (? OR EXISTS(SELECT 1 FROM settlements))
+                 AND NOT EXISTS(SELECT 1 FROM monthly_settlement_summary)''', (has_archived,))
+    return migrated or bool(c.fetchone()[0])
+
+# 검색 색인 문서 SQL ({row}: 트리거의 NEW 행 또는 원본 테이블 별칭)
+# ledger 컬럼은 장부 id - MATCH 식에 함께 넣어 한 장부의 문서만 색인에서 찾음
+TRANSACTION_SEARCH_INSERT_SQL = '''
+    INSERT INTO transaction_search (rowid, description, members, ledger)
+    SELECT {row}.id, {row}.description,
+           (SELECT group_concat(value, ' ') FROM json_each({row}.members)), {row}.ledger_id'''
+
+SETTLEMENT_SEARCH_INSERT_SQL = '''
+    INSERT INTO settlement_search (rowid, name, members, descriptions, ledger)
+    SELECT {row}.id, {row}.name,
+           (SELECT group_concat(key, ' ') FROM json_each({row}.settlement_data)),
+           (SELECT group_concat(description, ' ') FROM
+               (SELECT DISTINCT json_extract(t.value, '$.description') AS description
+                FROM json_each({row}.settlement_data) m, json_each(m.value, '$.transactions') t)),
+           {row}.ledger_id'''
+
+SEARCH_INDEX_TRIGGERS = {
+    'transaction_search': ('transactions_search_insert', 'transactions_search_delete', 'transactions_search_update'),
+    'settlement_search': ('settlements_search_insert', 'settlements_search_delete', 'settlements_search_update'),
+}
+
+# 전문 검색(FTS5) 색인 및 동기화 트리거 생성 (rowid = 원본 테이블 id, 보관 DB는 정산 색인만)
+def init_search_index(c, include_transactions=True):
+    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name IN ('transaction_search', 'settlement_search')")
+    existing = {row[0] for row in c.fetchall()}
+    
+    # 장부 컬럼이 없는 이전 형식 색인은 지우고 다시 만듦
+    for table in sorted(existing):
+        c.execute(f"SELECT name FROM pragma_table_info('{table}')")
+        if 'ledger' not in {row[0] for row in c.fetchall()}:
+            for trigger in SEARCH_INDEX_TRIGGERS[table]:
+                c.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            c.execute(f'DROP TABLE {table}')
+            existing.discard(table)
+    
+    # 거래 설명/참여자, 정산 이름/참여자/거래 설명 색인 (접두어 검색용 prefix 색인 포함)
+    if include_transactions:
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS transaction_search
+                     USING fts5(description, members, ledger, prefix='1 2 3')''')
+        insert_transaction = TRANSACTION_SEARCH_INSERT_SQL.format(row='NEW')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS transactions_search_insert
+                      AFTER INSERT ON transactions BEGIN {insert_transaction}; END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS transactions_search_delete
+                     AFTER DELETE ON transactions BEGIN DELETE FROM transaction_search WHERE rowid = OLD.id; END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS transactions_search_update
+                      AFTER UPDATE ON transactions BEGIN
+                      DELETE FROM transaction_search WHERE rowid = OLD.id; {insert_transaction}; END''')
+    
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS settlement_search
+                 USING fts5(name, members, descriptions, ledger, prefix='1 2 3')''')
+    insert_settlement = SETTLEMENT_SEARCH_INSERT_SQL.format(row='NEW')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS settlements_search_insert
+                  AFTER INSERT ON settlements BEGIN {insert_settlement}; END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS settlements_search_delete
+                 AFTER DELETE ON settlements BEGIN DELETE FROM settlement_search WHERE rowid = OLD.id; END''')
+    c.execute(f'''CREATE TRIGGER IF NOT EXISTS settlements_search_update
+                  AFTER UPDATE ON settlements BEGIN
+                  DELETE FROM settlement_search WHERE rowid = OLD.id; {insert_settlement}; END''')
+    
+    # 색인을 처음 만든 경우 기존 거래/정산 기록 백필
+    if len(existing) < (2 if include_transactions else 1):
+        _rebuild_search_index(c, include_transactions)
+
+def _rebuild_search_index(c, include_transactions=True):
+    if include_transactions:
+        c.execute('DELETE FROM transaction_search')
+        c.execute(TRANSACTION_SEARCH_INSERT_SQL.format(row='transactions') + ' FROM transactions')
+    c.execute('DELETE FROM settlement_search')
+    c.execute(SETTLEMENT_SEARCH_INSERT_SQL.format(row='settlements') + ' FROM settlements')
+
+def _rebuild_analytics(c):
+    c.execute('DELETE FROM member_monthly_spend')
+    c.execute('DELETE FROM monthly_settlement_summary')
+    for sql in _analytics_sql('settlements', 1):
+        c.execute(sql)
+
+# 정산 결과 테이블 생성 (운영 DB와 연도별 보관 DB 공용)
+def create_settlements_table(c):
     c.execute('''CREATE TABLE IF NOT EXISTS settlements
                  (id INTEGER PRIMARY KEY, name TEXT, date TEXT, 
                   total_amount REAL, member_count INTEGER, 
@@ -28,14 +226,109 @@ def init_db():
     except sqlite3.OperationalError:
         pass  # 이미 컬럼이 있으면 무시
     
+    # ledger_id 컬럼이 없으면 추가 (기존 정산은 기본 장부)
+    try:
+        c.execute(f"ALTER TABLE settlements ADD COLUMN ledger_id INTEGER NOT NULL DEFAULT {DEFAULT_LEDGER_ID}")
+    except sqlite3.OperationalError:
+        pass  # 이미 컬럼이 있으면 무시
+    
+    # 장부별 날짜순 조회, 보관 대상 검색용 인덱스
+    c.execute('CREATE INDEX IF NOT EXISTS idx_settlements_ledger_date ON settlements (ledger_id, date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_settlements_date ON settlements (date)')
+
+# 연도별 보관 DB 초기화 (정산 테이블 + 정산 검색 색인, 분석 테이블은 운영 DB에만 있음)
+def init_archive_db(path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    create_settlements_table(c)
+    init_search_index(c, include_transactions=False)
     conn.commit()
     conn.close()
 
+# 보관 DB 중 정산 기록이 남아 있는 것이 있는지
+def _archives_have_settlements():
+    for year in list_archive_years():
+        conn = sqlite3.connect(archive_db_path(year))
+        exists = conn.execute('SELECT EXISTS(SELECT 1 FROM settlements)').fetchone()[0]
+        conn.close()
+        if exists:
+            return True
+    return False
+
+# DB 초기화
+def init_db(db_path=DB_PATH):
+    # 보관 DB를 먼저 현재 스키마로 맞춤 (분석 재집계 시 함께 읽음)
+    uses_archives = db_path == DB_PATH
+    if uses_archives:
+        for year in list_archive_years():
+            init_archive_db(archive_db_path(year))
+    
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    
+    # 장부 테이블
+    c.execute('''CREATE TABLE IF NOT EXISTS ledgers
+                 (id INTEGER PRIMARY KEY, name TEXT UNIQUE, created_at TEXT)''')
+    c.execute('INSERT OR IGNORE INTO ledgers (id, name, created_at) VALUES (?, ?, ?)',
+              (DEFAULT_LEDGER_ID, DEFAULT_LEDGER_NAME, datetime.now().isoformat()))
+    
+    # 거래 내역 테이블
+    c.execute('''CREATE TABLE IF NOT EXISTS transactions
+                 (id INTEGER PRIMARY KEY, date TEXT, description TEXT, 
+                  amount REAL, members TEXT, member_amounts TEXT, 
+                  created_at TEXT, updated_at TEXT)''')
+    
+    # ledger_id 컬럼이 없으면 추가 (기존 거래는 기본 장부)
+    try:
+        c.execute(f"ALTER TABLE transactions ADD COLUMN ledger_id INTEGER NOT NULL DEFAULT {DEFAULT_LEDGER_ID}")
+    except sqlite3.OperationalError:
+        pass  # 이미 컬럼이 있으면 무시
+    c.execute('CREATE INDEX IF NOT EXISTS idx_transactions_ledger_date ON transactions (ledger_id, date)')
+    
+    # 정산 결과 테이블
+    create_settlements_table(c)
+    
+    # 분석 테이블 (정산 저장/삭제 시 트리거로 자동 갱신)
+    needs_analytics_rebuild = init_analytics(c, uses_archives and _archives_have_settlements())
+    
+    # 전문 검색 색인 (거래/정산 추가·수정·삭제 시 트리거로 자동 갱신)
+    init_search_index(c)
+    
+    conn.commit()
+    conn.close()
+    
+    if needs_analytics_rebuild:
+        rebuild_analytics(db_path)
+
+# DB에서 장부 목록 로드
+def load_ledgers_from_db(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute('SELECT id, name, created_at FROM ledgers ORDER BY id')
+    rows = c.fetchall()
+    conn.close()
+    return [{'id': row[0], 'name': row[1], 'created_at': row[2]} for row in rows]
+
+# DB에 장부 추가 (같은 이름이 있으면 ValueError)
+def create_ledger_in_db(name, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    try:
+        c.execute('INSERT INTO ledgers (name, created_at) VALUES (?, ?)', (name, datetime.now().isoformat()))
+    except sqlite3.IntegrityError:
+        conn.close()
+        raise ValueError(f"이미 있는 장부 이름입니다: {name}")
+    ledger_id = c.lastrowid
+    conn.commit()
+    conn.close()
+    return ledger_id
+
 # DB에서 거래 내역 로드
-def load_transactions_from_db():
-    conn = sqlite3.connect('settlement.db')
+def load_transactions_from_db(ledger_id=DEFAULT_LEDGER_ID, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
-    c.execute('SELECT * FROM transactions ORDER BY date DESC')
+    c.execute('SELECT * FROM transactions WHERE ledger_id=? ORDER BY date DESC', (ledger_id,))
     rows = c.fetchall()
     conn.close()
     
@@ -49,30 +342,33 @@ def load_transactions_from_db():
             'members': json.loads(row[4]),
             'member_amounts': json.loads(row[5]),
             'created_at': row[6],
-            'updated_at': row[7] if row[7] else None
+            'updated_at': row[7] if row[7] else None,
+            'ledger_id': row[8]
         }
         transactions.append(transaction)
     
     return transactions
 
 # DB에 거래 저장
-def save_transaction_to_db(transaction):
-    conn = sqlite3.connect('settlement.db')
+def save_transaction_to_db(transaction, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
     
     c.execute('''INSERT INTO transactions 
-                 (date, description, amount, members, member_amounts, created_at)
-                 VALUES (?, ?, ?, ?, ?, ?)''',
+                 (date, description, amount, members, member_amounts, created_at, ledger_id)
+                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
               (transaction['date'], transaction['description'], transaction['amount'],
                json.dumps(transaction['members']), json.dumps(transaction['member_amounts']),
-               transaction['created_at']))
+               transaction['created_at'], transaction.get('ledger_id', DEFAULT_LEDGER_ID)))
+    transaction_id = c.lastrowid
     
     conn.commit()
     conn.close()
+    return transaction_id
 
 # DB에 거래 업데이트
-def update_transaction_in_db(transaction):
-    conn = sqlite3.connect('settlement.db')
+def update_transaction_in_db(transaction, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
     
     c.execute('''UPDATE transactions 
@@ -86,54 +382,1051 @@ def update_transaction_in_db(transaction):
     conn.close()
 
 # DB에서 거래 삭제
-def delete_transaction_from_db(transaction_id):
-    conn = sqlite3.connect('settlement.db')
+def delete_transaction_from_db(transaction_id, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
     c.execute('DELETE FROM transactions WHERE id=?', (transaction_id,))
     conn.commit()
     conn.close()
 
+# DB에서 한 장부의 진행 중인 거래 전체 삭제 (정산 저장 후)
+def clear_transactions_in_db(ledger_id=DEFAULT_LEDGER_ID, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute('DELETE FROM transactions WHERE ledger_id=?', (ledger_id,))
+    conn.commit()
+    conn.close()
+
 # DB에 정산 결과 저장 (사진 경로 추가)
-def save_settlement_to_db(name, date, total_amount, member_count, settlement_data, image_path=None):
-    conn = sqlite3.connect('settlement.db')
+def save_settlement_to_db(name, date, total_amount, member_count, settlement_data, image_path=None,
+                          ledger_id=DEFAULT_LEDGER_ID, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
     c.execute('''INSERT INTO settlements 
-                 (name, date, total_amount, member_count, settlement_data, created_at, image_path)
-                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
-              (name, date, total_amount, member_count, json.dumps(settlement_data), datetime.now().isoformat(), image_path))
+                 (name, date, total_amount, member_count, settlement_data, created_at, image_path, ledger_id)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+              (name, date, total_amount, member_count, json.dumps(settlement_data), datetime.now().isoformat(), image_path, ledger_id))
+    settlement_id = c.lastrowid
     conn.commit()
     conn.close()
+    return settlement_id
 
-# DB에서 정산 결과 로드 (사진 경로 포함)
-def load_settlements_from_db():
-    conn = sqlite3.connect('settlement.db')
+def archive_db_path(year):
+    return os.path.join(ARCHIVE_DIR, f"settlement_{year}.db")
+
+def list_archive_years():
+    """보관 DB가 있는 연도 목록 (최신순)"""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    names = [name for name in os.listdir(ARCHIVE_DIR) if name.startswith('settlement_') and name.endswith('.db')]
+    return sorted((name[len('settlement_'):-len('.db')] for name in names), reverse=True)
+
+def _settlement_from_row(row, archive_year=None):
+    return {
+        'id': row[0],
+        'name': row[1],
+        'date': row[2],
+        'total_amount': row[3],
+        'member_count': row[4],
+        'settlement_data': json.loads(row[5]),
+        'created_at': row[6],
+        'image_path': row[7],
+        'ledger_id': row[8],
+        'archive_year': archive_year  # None이면 운영 DB
+    }
+
+# DB에서 한 장부의 정산 결과 로드 (사진 경로 포함, archive_years에 지정한 연도의 보관 DB만 ATTACH 해서 함께 조회)
+def load_settlements_from_db(archive_years=(), ledger_id=DEFAULT_LEDGER_ID, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
-    # image_path 컬럼 추가
-    c.execute('SELECT id, name, date, total_amount, member_count, settlement_data, created_at, image_path FROM settlements ORDER BY date DESC')
-    rows = c.fetchall()
+    c.execute(f'SELECT {SETTLEMENT_COLUMNS} FROM settlements WHERE ledger_id=? ORDER BY date DESC', (ledger_id,))
+    settlements = [_settlement_from_row(row) for row in c.fetchall()]
+    for year in archive_years:
+        c.execute("ATTACH DATABASE ? AS archive", (archive_db_path(year),))
+        c.execute(f'SELECT {SETTLEMENT_COLUMNS} FROM archive.settlements WHERE ledger_id=? ORDER BY date DESC', (ledger_id,))
+        settlements += [_settlement_from_row(row, year) for row in c.fetchall()]
+        c.execute("DETACH DATABASE archive")
     conn.close()
-    settlements = []
-    for row in rows:
-        settlement = {
-            'id': row[0],
-            'name': row[1],
-            'date': row[2],
-            'total_amount': row[3],
-            'member_count': row[4],
-            'settlement_data': json.loads(row[5]),
-            'created_at': row[6],
-            'image_path': row[7]
-        }
-        settlements.append(settlement)
+    if archive_years:
+        settlements.sort(key=lambda settlement: settlement['date'], reverse=True)
     return settlements
 
-# DB에서 정산 결과 삭제
-def delete_settlement_from_db(settlement_id):
-    conn = sqlite3.connect('settlement.db')
+# DB에서 정산 결과 삭제 (archive_year를 주면 해당 연도 보관 DB에서 삭제)
+def delete_settlement_from_db(settlement_id, archive_year=None, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    if archive_year is None:
+        c.execute('DELETE FROM settlements WHERE id=?', (settlement_id,))
+    else:
+        c.execute("ATTACH DATABASE ? AS archive", (archive_db_path(archive_year),))
+        # 분석 테이블은 운영 DB 트리거로만 갱신되므로 보관된 정산은 직접 차감
+        source = "(SELECT id, ledger_id, date, total_amount, settlement_data FROM archive.settlements WHERE id = ?)"
+        for sql in _analytics_sql(source, -1):
+            c.execute(sql, (settlement_id,))
+        for sql in ANALYTICS_CLEANUP_SQL.split(';'):
+            c.execute(sql)
+        c.execute('DELETE FROM archive.settlements WHERE id=?', (settlement_id,))
+        conn.commit()
+        c.execute("DETACH DATABASE archive")
+    conn.commit()
+    conn.close()
+
+# cutoff_date('YYYY-MM-DD') 이전 정산을 연도별 보관 DB로 이동 (연도별 이동 건수 반환)
+def archive_settlements(cutoff_date):
+    conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
-    c.execute('DELETE FROM settlements WHERE id=?', (settlement_id,))
+    c.execute('SELECT DISTINCT substr(date, 1, 4) FROM settlements WHERE date < ?', (cutoff_date,))
+    years = [row[0] for row in c.fetchall()]
+    
+    moved = {}
+    for year in years:
+        init_archive_db(archive_db_path(year))
+        c.execute("ATTACH DATABASE ? AS archive", (archive_db_path(year),))
+        params = (cutoff_date, year)
+        
+        # 보관한 정산도 분석 대상이므로 삭제 트리거가 빼는 만큼 먼저 더해 둠
+        source = "(SELECT id, ledger_id, date, total_amount, settlement_data FROM main.settlements WHERE date < ? AND substr(date, 1, 4) = ?)"
+        for sql in _analytics_sql(source, 1):
+            c.execute(sql, params)
+        
+        # 보관 DB의 id는 보관 DB 안에서만 유일 (검색 색인은 보관 DB 트리거가 갱신)
+        c.execute('''INSERT INTO archive.settlements
+                     (name, date, total_amount, member_count, settlement_data, created_at, image_path, ledger_id)
+                     SELECT name, date, total_amount, member_count, settlement_data, created_at, image_path, ledger_id
+                     FROM main.settlements WHERE date < ? AND substr(date, 1, 4) = ?
+                     ORDER BY date, id''', params)
+        moved[year] = c.rowcount
+        c.execute('DELETE FROM main.settlements WHERE date < ? AND substr(date, 1, 4) = ?', params)
+        conn.commit()
+        c.execute("DETACH DATABASE archive")
+    
+    conn.close()
+    return moved
+
+# 기존 정산 기록(운영 DB라면 보관 DB 포함)으로 분석 테이블 재집계
+def rebuild_analytics(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    _rebuild_analytics(c)
+    c.execute('SELECT COUNT(*) FROM settlements')
+    count = c.fetchone()[0]
     conn.commit()
+    for year in (list_archive_years() if db_path == DB_PATH else []):
+        c.execute("ATTACH DATABASE ? AS archive", (archive_db_path(year),))
+        for sql in _analytics_sql('archive.settlements', 1):
+            c.execute(sql)
+        c.execute('SELECT COUNT(*) FROM archive.settlements')
+        count += c.fetchone()[0]
+        conn.commit()
+        c.execute("DETACH DATABASE archive")
+    conn.close()
+    return count
+
+# 검색 색인 재생성 (보관 DB 포함)
+def rebuild_search_index():
+    conn = sqlite3.connect(DB_PATH)
+    c = conn.cursor()
+    _rebuild_search_index(c)
+    conn.commit()
+    conn.close()
+    for year in list_archive_years():
+        conn = sqlite3.connect(archive_db_path(year))
+        c = conn.cursor()
+        _rebuild_search_index(c, include_transactions=False)
+        conn.commit()
+        conn.close()
+
+def _fts_query(text):
+    """사용자 입력을 FTS5 쿼리로 변환 (단어별 접두어 검색, 모든 단어 포함)
+
+    문장 부호만으로 된 단어는 토큰이 없는 빈 구문이 되어 전체 검색을 실패시키므로 뺀다.
+    """
+    terms = [term.replace('"', '""') for term in text.split() if any(ch.isalnum() for ch in term)]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def _ledger_fts_query(fts_query, ledger_id):
+    """한 장부의 문서로 범위를 좁힌 FTS5 쿼리 (색인의 ledger 컬럼으로 거르고, 검색어는 ledger 외 컬럼에서만 찾음)"""
+    return f'ledger : "{int(ledger_id)}" AND (- ledger : ({fts_query}))'
+
+def _search_settlements(c, fts_query, limit, schema='main', archive_year=None):
+    # bm25 가중치: 정산 이름 > 참여자 > 거래 설명 (장부 컬럼은 순위에 반영 안 함)
+    c.execute(f'''SELECT s.id, s.name, s.date, s.total_amount,
+                         snippet(settlement_search, -1, '**', '**', '…', 8),
+                         bm25(settlement_search, 10.0, 5.0, 1.0, 0.0) AS rank
+                  FROM {schema}.settlement_search JOIN {schema}.settlements s ON s.id = settlement_search.rowid
+                  WHERE settlement_search MATCH ? ORDER BY rank LIMIT ?''', (fts_query, limit))
+    return [{'kind': 'settlement', 'id': row[0], 'name': row[1], 'date': row[2], 'amount': row[3],
+             'snippet': row[4], 'rank': row[5], 'archive_year': archive_year} for row in c.fetchall()]
+
+# 한 장부의 정산 기록/진행 중인 거래 전문 검색 (archive_years에 지정한 연도의 보관 DB도 검색)
+# bm25 점수는 색인마다 통계와 가중치가 달라 서로 비교할 수 없으므로, 출처(운영 정산 → 보관 연도별 정산 → 거래)별로
+# 묶어 반환하고 관련도 순위는 묶음 안에서만 매김 (묶음마다 최대 limit건)
+def search_history(query, limit=50, archive_years=(), ledger_id=DEFAULT_LEDGER_ID, db_path=DB_PATH):
+    fts_query = _fts_query(query)
+    if not fts_query:
+        return []
+    fts_query = _ledger_fts_query(fts_query, ledger_id)
+    
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    hits = _search_settlements(c, fts_query, limit)
+    for year in archive_years:
+        c.execute("ATTACH DATABASE ? AS archive", (archive_db_path(year),))
+        hits += _search_settlements(c, fts_query, limit, 'archive', year)
+        c.execute("DETACH DATABASE archive")
+    c.execute('''SELECT t.id, t.description, t.date, t.amount,
+                        snippet(transaction_search, -1, '**', '**', '…', 8),
+                        bm25(transaction_search, 5.0, 1.0, 0.0) AS rank
+                 FROM transaction_search JOIN transactions t ON t.id = transaction_search.rowid
+                 WHERE transaction_search MATCH ? ORDER BY rank LIMIT ?''', (fts_query, limit))
+    hits += [{'kind': 'transaction', 'id': row[0], 'name': row[1], 'date': row[2], 'amount': row[3],
+              'snippet': row[4], 'rank': row[5], 'archive_year': None} for row in c.fetchall()]
+    conn.close()
+    return hits
+
+# 한 장부의 기간별 멤버 x 월 지출 조회 (month: 'YYYY-MM')
+def load_member_monthly_spend(start_month, end_month, ledger_id=DEFAULT_LEDGER_ID, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute('''SELECT month, member, total_amount, settlement_count FROM member_monthly_spend
+                 WHERE ledger_id = ? AND month BETWEEN ? AND ? ORDER BY month, member''', (ledger_id, start_month, end_month))
+    rows = c.fetchall()
+    conn.close()
+    return [{'month': row[0], 'member': row[1], 'total_amount': row[2], 'settlement_count': row[3]}
+            for row in rows]
+
+# 한 장부의 기간별 월 정산 요약 조회 (month: 'YYYY-MM')
+def load_monthly_settlement_summary(start_month, end_month, ledger_id=DEFAULT_LEDGER_ID, db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute('''SELECT month, settlement_count, total_amount FROM monthly_settlement_summary
+                 WHERE ledger_id = ? AND month BETWEEN ? AND ? ORDER BY month''', (ledger_id, start_month, end_month))
+    rows = c.fetchall()
+    conn.close()
+    return [{'month': row[0], 'settlement_count': row[1], 'total_amount': row[2]} for row in rows]
+
+class SettlementRepository(ABC):
+    """거래/정산/첨부 사진 저장소 인터페이스 (SQLiteRepository, InMemoryRepository)
+
+    거래와 정산은 dict로 주고받으며 형식은 load_transactions_from_db / load_settlements_from_db 결과와 같다.
+    거래/정산/검색/분석은 ledger_id로 지정한 장부 하나의 범위에서만 동작한다.
+    archive_years는 연도별 보관 DB를 지원하는 저장소에서만 의미가 있다.
+    """
+    
+    # 장부
+    @abstractmethod
+    def load_ledgers(self):
+        """장부 목록 ({'id', 'name', 'created_at'}, id 순)"""
+    
+    @abstractmethod
+    def create_ledger(self, name):
+        """장부를 추가하고 새 장부 id 반환 (이름이 겹치면 ValueError)"""
+    
+    # 거래
+    @abstractmethod
+    def load_transactions(self, ledger_id=DEFAULT_LEDGER_ID):
+        ...
+    
+    @abstractmethod
+    def save_transaction(self, transaction):
+        """저장하고 새 거래 id 반환 (transaction['ledger_id']가 없으면 기본 장부)"""
+    
+    @abstractmethod
+    def update_transaction(self, transaction):
+        ...
+    
+    @abstractmethod
+    def delete_transaction(self, transaction_id):
+        ...
+    
+    @abstractmethod
+    def clear_transactions(self, ledger_id=DEFAULT_LEDGER_ID):
+        ...
+    
+    # 정산
+    @abstractmethod
+    def save_settlement(self, name, date, total_amount, member_count, settlement_data, image_path=None,
+                        ledger_id=DEFAULT_LEDGER_ID):
+        """저장하고 새 정산 id 반환"""
+    
+    @abstractmethod
+    def load_settlements(self, archive_years=(), ledger_id=DEFAULT_LEDGER_ID):
+        ...
+    
+    @abstractmethod
+    def delete_settlement(self, settlement_id, archive_year=None):
+        ...
+    
+    def list_archive_years(self):
+        return []
+    
+    # 첨부 사진
+    @abstractmethod
+    def load_attachment_paths(self):
+        """모든 장부의 정산 기록이 참조하는 첨부 사진 경로 (저장된 그대로)"""
+    
+    # 검색/분석
+    @abstractmethod
+    def search(self, query, limit=50, archive_years=(), ledger_id=DEFAULT_LEDGER_ID):
+        """출처(정산/보관 연도/거래)별로 묶인 검색 결과 - 관련도 순위(rank)는 묶음 안에서만 의미가 있음"""
+    
+    @abstractmethod
+    def load_member_monthly_spend(self, start_month, end_month, ledger_id=DEFAULT_LEDGER_ID):
+        ...
+    
+    @abstractmethod
+    def load_monthly_settlement_summary(self, start_month, end_month, ledger_id=DEFAULT_LEDGER_ID):
+        ...
+
+
+class SQLiteRepository(SettlementRepository):
+    """SQLite 파일 저장소 (분석 테이블/검색 색인은 트리거로 유지, archives=True면 연도별 보관 DB 지원)
+
+    ARCHIVE_DIR의 보관 DB는 운영 DB(DB_PATH)에 딸린 것이므로 archives를 생략하면 db_path가 DB_PATH일 때만 사용한다.
+    """
+    
+    def __init__(self, db_path=DB_PATH, archives=None):
+        self.db_path = db_path
+        self.archives = db_path == DB_PATH if archives is None else archives
+        init_db(db_path)
+    
+    def load_ledgers(self):
+        return load_ledgers_from_db(db_path=self.db_path)
+    
+    def create_ledger(self, name):
+        return create_ledger_in_db(name, db_path=self.db_path)
+    
+    def load_transactions(self, ledger_id=DEFAULT_LEDGER_ID):
+        return load_transactions_from_db(ledger_id, db_path=self.db_path)
+    
+    def save_transaction(self, transaction):
+        return save_transaction_to_db(transaction, self.db_path)
+    
+    def update_transaction(self, transaction):
+        update_transaction_in_db(transaction, self.db_path)
+    
+    def delete_transaction(self, transaction_id):
+        delete_transaction_from_db(transaction_id, self.db_path)
+    
+    def clear_transactions(self, ledger_id=DEFAULT_LEDGER_ID):
+        clear_transactions_in_db(ledger_id, db_path=self.db_path)
+    
+    def save_settlement(self, name, date, total_amount, member_count, settlement_data, image_path=None,
+                        ledger_id=DEFAULT_LEDGER_ID):
+        return save_settlement_to_db(name, date, total_amount, member_count, settlement_data, image_path,
+                                     ledger_id=ledger_id, db_path=self.db_path)
+    
+    def load_settlements(self, archive_years=(), ledger_id=DEFAULT_LEDGER_ID):
+        return load_settlements_from_db(archive_years, ledger_id=ledger_id, db_path=self.db_path)
+    
+    def delete_settlement(self, settlement_id, archive_year=None):
+        delete_settlement_from_db(settlement_id, archive_year, self.db_path)
+    
+    def list_archive_years(self):
+        return list_archive_years() if self.archives else []
+    
+    def load_attachment_paths(self):
+        paths = load_attachment_paths(self.db_path)
+        for year in self.list_archive_years():
+            paths += load_attachment_paths(archive_db_path(year))
+        return sorted(set(paths))
+    
+    def search(self, query, limit=50, archive_years=(), ledger_id=DEFAULT_LEDGER_ID):
+        return search_history(query, limit, archive_years, ledger_id=ledger_id, db_path=self.db_path)
+    
+    def load_member_monthly_spend(self, start_month, end_month, ledger_id=DEFAULT_LEDGER_ID):
+        return load_member_monthly_spend(start_month, end_month, ledger_id=ledger_id, db_path=self.db_path)
+    
+    def load_monthly_settlement_summary(self, start_month, end_month, ledger_id=DEFAULT_LEDGER_ID):
+        return load_monthly_settlement_summary(start_month, end_month, ledger_id=ledger_id, db_path=self.db_path)
+
+
+class InMemoryRepository(SettlementRepository):
+    """메모리 저장소 - 변경 내역을 snapshot_interval초마다 JSONL 파일 끝에 덧붙여 기록하고, 시작할 때 재생해 복구
+
+    snapshot_path가 None이면 디스크에 기록하지 않는다. 마지막 기록 이후의 변경은 프로세스가 죽으면 사라진다.
+    기록 중에 죽어 마지막 줄이 잘렸으면 시작할 때 그 줄을 잘라 내고, 변경 내역이 쌓이면 현재 상태만 담도록 파일을 압축한다.
+    """
+    
+    def __init__(self, snapshot_path=None, snapshot_interval=MEMORY_SNAPSHOT_INTERVAL_SECONDS):
+        self.snapshot_path = snapshot_path
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()  # 파일 기록 순서 보장 (flush/compact 사이)
+        self._journal_entries = 0  # 파일에 기록된 변경 내역 수
+        self._ledgers = {DEFAULT_LEDGER_ID: {'id': DEFAULT_LEDGER_ID, 'name': DEFAULT_LEDGER_NAME,
+                                             'created_at': datetime.now().isoformat()}}
+        self._transactions = {}
+        self._settlements = {}
+        self._next_ids = {'ledger': DEFAULT_LEDGER_ID + 1, 'transaction': 1, 'settlement': 1}
+        self._pending = []  # 아직 디스크에 기록하지 않은 변경 내역
+        
+        if snapshot_path and os.path.exists(snapshot_path):
+            self._replay()
+        if snapshot_path and snapshot_interval > 0:
+            threading.Thread(target=_run_periodically, args=(snapshot_interval, self._persist),
+                             name="memory-snapshot", daemon=True).start()
+    
+    def _replay(self):
+        """기록 파일 재생 (마지막 줄만 잘린 경우 그 줄을 잘라 냄, 중간 줄이 깨졌으면 ValueError)"""
+        with open(self.snapshot_path, 'rb') as f:
+            data = f.read()
+        lines = data.split(b"\n")
+        offset = 0
+        for number, line in enumerate(lines):
+            is_last = number == len(lines) - 1
+            if line.strip():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    if not is_last:
+                        raise ValueError(f"{self.snapshot_path}:{number + 1} 기록이 손상되었습니다")
+                    break  # 기록 중에 죽어 잘린 마지막 줄
+                if is_last:
+                    break  # 줄바꿈 전에 죽었으면 다음 기록이 붙지 않도록 버림 (flush가 끝나지 않은 변경)
+                self._apply(entry)
+                self._journal_entries += 1
+            offset += len(line) + 1
+        if offset < len(data):
+            with open(self.snapshot_path, 'r+b') as f:
+                f.truncate(offset)
+                os.fsync(f.fileno())
+    
+    def _apply(self, entry):
+        op, record = entry['op'], entry.get('record')
+        if op in ('put_transaction', 'put_settlement'):
+            record.setdefault('ledger_id', DEFAULT_LEDGER_ID)  # 장부 도입 전 기록은 기본 장부
+        if op == 'next_ids':
+            self._next_ids.update(record)
+        elif op == 'put_ledger':
+            self._ledgers[record['id']] = record
+        elif op == 'put_transaction':
+            self._transactions[record['id']] = record
+        elif op == 'delete_transaction':
+            self._transactions.pop(entry['id'], None)
+        elif op == 'clear_transactions':
+            ledger_id = entry.get('ledger_id', DEFAULT_LEDGER_ID)
+            self._transactions = {k: t for k, t in self._transactions.items() if t['ledger_id'] != ledger_id}
+        elif op == 'put_settlement':
+            self._settlements[record['id']] = record
+        elif op == 'delete_settlement':
+            self._settlements.pop(entry['id'], None)
+        kind = {'put_ledger': 'ledger', 'put_transaction': 'transaction', 'put_settlement': 'settlement'}.get(op)
+        if kind:
+            self._next_ids[kind] = max(self._next_ids[kind], record['id'] + 1)
+    
+    def _record(self, entry):
+        with self._lock:
+            self._apply(entry)
+            if self.snapshot_path:
+                self._pending.append(entry)
+    
+    def flush(self):
+        """쌓인 변경 내역을 스냅샷 파일 끝에 덧붙임"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            with open(self.snapshot_path, 'a', encoding='utf-8') as f:
+                for entry in pending:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_entries += len(pending)
+    
+    def compact(self):
+        """현재 상태만 담은 새 파일로 기록 파일을 원자적으로 교체 (이전 변경 내역은 버림)"""
+        with self._flush_lock:
+            with self._lock:
+                entries = [{'op': 'next_ids', 'record': dict(self._next_ids)}]
+                entries += [{'op': 'put_ledger', 'record': r} for r in self._ledgers.values()]
+                entries += [{'op': 'put_transaction', 'record': r} for r in self._transactions.values()]
+                entries += [{'op': 'put_settlement', 'record': r} for r in self._settlements.values()]
+                lines = [json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries]
+                self._pending = []  # 이미 현재 상태에 반영됨
+            tmp_path = f"{self.snapshot_path}.compact"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            self._journal_entries = len(lines)
+    
+    def _persist(self):
+        """주기 작업: 변경 내역 기록 후 필요하면 압축"""
+        self.flush()
+        with self._lock:
+            live = len(self._ledgers) + len(self._transactions) + len(self._settlements) + 1
+        if self._journal_entries > max(MEMORY_COMPACT_MIN_ENTRIES, 2 * live):
+            self.compact()
+    
+    def _new_id(self, kind):
+        with self._lock:
+            new_id = self._next_ids[kind]
+            self._next_ids[kind] += 1
+            return new_id
+    
+    def load_ledgers(self):
+        with self._lock:
+            return [dict(ledger) for _, ledger in sorted(self._ledgers.items())]
+    
+    def create_ledger(self, name):
+        with self._lock:
+            if any(ledger['name'] == name for ledger in self._ledgers.values()):
+                raise ValueError(f"이미 있는 장부 이름입니다: {name}")
+            record = {'id': self._new_id('ledger'), 'name': name, 'created_at': datetime.now().isoformat()}
+            self._record({'op': 'put_ledger', 'record': record})
+        return record['id']
+    
+    def load_transactions(self, ledger_id=DEFAULT_LEDGER_ID):
+        with self._lock:
+            transactions = [dict(t, members=list(t['members']), member_amounts=list(t['member_amounts']))
+                            for t in self._transactions.values() if t['ledger_id'] == ledger_id]
+        return sorted(transactions, key=lambda t: t['date'], reverse=True)
+    
+    def save_transaction(self, transaction):
+        record = {
+            'id': self._new_id('transaction'),
+            'date': transaction['date'],
+            'description': transaction['description'],
+            'amount': transaction['amount'],
+            'members': list(transaction['members']),
+            'member_amounts': list(transaction['member_amounts']),
+            'created_at': transaction['created_at'],
+            'updated_at': None,
+            'ledger_id': transaction.get('ledger_id', DEFAULT_LEDGER_ID)
+        }
+        self._record({'op': 'put_transaction', 'record': record})
+        return record['id']
+    
+    def update_transaction(self, transaction):
+        with self._lock:
+            existing = self._transactions.get(transaction['id'])
+            if existing is None:
+                return
+            record = dict(existing, date=transaction['date'], description=transaction['description'],
+                          amount=transaction['amount'], members=list(transaction['members']),
+                          member_amounts=list(transaction['member_amounts']), updated_at=transaction['updated_at'])
+            self._record({'op': 'put_transaction', 'record': record})
+    
+    def delete_transaction(self, transaction_id):
+        self._record({'op': 'delete_transaction', 'id': transaction_id})
+    
+    def clear_transactions(self, ledger_id=DEFAULT_LEDGER_ID):
+        self._record({'op': 'clear_transactions', 'ledger_id': ledger_id})
+    
+    def save_settlement(self, name, date, total_amount, member_count, settlement_data, image_path=None,
+                        ledger_id=DEFAULT_LEDGER_ID):
+        record = {
+            'id': self._new_id('settlement'),
+            'name': name,
+            'date': date,
+            'total_amount': total_amount,
+            'member_count': member_count,
+            'settlement_data': json.loads(json.dumps(settlement_data)),
+            'created_at': datetime.now().isoformat(),
+            'image_path': image_path,
+            'ledger_id': ledger_id,
+            'archive_year': None
+        }
+        self._record({'op': 'put_settlement', 'record': record})
+        return record['id']
+    
+    def load_settlements(self, archive_years=(), ledger_id=DEFAULT_LEDGER_ID):
+        with self._lock:
+            settlements = [json.loads(json.dumps(s)) for s in self._settlements.values() if s['ledger_id'] == ledger_id]
+        return sorted(settlements, key=lambda s: s['date'], reverse=True)
+    
+    def delete_settlement(self, settlement_id, archive_year=None):
+        self._record({'op': 'delete_settlement', 'id': settlement_id})
+    
+    def load_attachment_paths(self):
+        with self._lock:
+            return sorted({p for s in self._settlements.values() for p in split_image_paths(s['image_path'])})
+    
+    def search(self, query, limit=50, archive_years=(), ledger_id=DEFAULT_LEDGER_ID):
+        """모든 단어가 포함된 정산, 거래를 각각 단어 등장 횟수 순으로 반환 (단순 부분 문자열 검색)"""
+        terms = [term.casefold() for term in query.split()]
+        if not terms:
+            return []
+        with self._lock:
+            documents = [('settlement', s['id'], s['name'], s['date'], s['total_amount'],
+                          ' '.join([s['name'], *s['settlement_data'],
+                                    *(t['description'] for d in s['settlement_data'].values() for t in d['transactions'])]))
+                         for s in self._settlements.values() if s['ledger_id'] == ledger_id]
+            documents += [('transaction', t['id'], t['description'], t['date'], t['amount'],
+                           ' '.join([t['description'], *t['members']]))
+                          for t in self._transactions.values() if t['ledger_id'] == ledger_id]
+        hits = []
+        for kind, doc_id, name, date, amount, text in documents:
+            folded = text.casefold()
+            if all(term in folded for term in terms):
+                hits.append({'kind': kind, 'id': doc_id, 'name': name, 'date': date, 'amount': amount,
+                             'snippet': text[:120], 'rank': -sum(folded.count(term) for term in terms), 'archive_year': None})
+        results = []
+        for kind in ('settlement', 'transaction'):
+            results += sorted((hit for hit in hits if hit['kind'] == kind), key=lambda hit: hit['rank'])[:limit]
+        return results
+    
+    def load_member_monthly_spend(self, start_month, end_month, ledger_id=DEFAULT_LEDGER_ID):
+        totals = {}
+        for settlement in self.load_settlements(ledger_id=ledger_id):
+            months_seen = set()
+            for member, data in settlement['settlement_data'].items():
+                for trans in data['transactions']:
+                    key = (trans['date'][:7], member)
+                    entry = totals.setdefault(key, {'total_amount': 0, 'settlement_count': 0})
+                    entry['total_amount'] += trans['amount']
+                    if key not in months_seen:
+                        months_seen.add(key)
+                        entry['settlement_count'] += 1
+        return [{'month': month, 'member': member, **entry} for (month, member), entry in sorted(totals.items())
+                if start_month <= month <= end_month]
+    
+    def load_monthly_settlement_summary(self, start_month, end_month, ledger_id=DEFAULT_LEDGER_ID):
+        totals = {}
+        for settlement in self.load_settlements(ledger_id=ledger_id):
+            entry = totals.setdefault(settlement['date'][:7], {'settlement_count': 0, 'total_amount': 0})
+            entry['settlement_count'] += 1
+            entry['total_amount'] += settlement['total_amount']
+        return [{'month': month, **entry} for month, entry in sorted(totals.items())
+                if start_month <= month <= end_month]
+
+
+def _storage_candidates(directory):
+    """처리량 비교용 저장소 (이름, 생성 함수) - directory 아래 임시 파일 사용"""
+    return [
+        ("sqlite", lambda: SQLiteRepository(os.path.join(directory, "bench.db"), archives=False)),
+        ("memory", lambda: InMemoryRepository()),
+        ("memory+snapshot", lambda: InMemoryRepository(os.path.join(directory, "bench.jsonl"), snapshot_interval=0)),
+    ]
+
+def benchmark_storage(count=2000):
+    """저장소별 처리량(초당 작업 수) 비교"""
+    transaction = {'date': '2025-03-01', 'description': '저녁 식사', 'amount': 30000.0, 'members': ['철수', '영희', '민수'],
+                   'member_amounts': [10000.0, 10000.0, 10000.0], 'created_at': '2025-03-01T19:00:00'}
+    settlement_data = {member: {'settlement_amount': 10000.0, 'transactions': [
+        {'date': '2025-03-01', 'description': '저녁 식사', 'amount': 10000.0, 'total_amount': 30000.0}]}
+        for member in transaction['members']}
+    
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="settlement_bench_") as directory:
+        for name, factory in _storage_candidates(directory):
+            repository = factory()
+            timings = {}
+            
+            start = time.perf_counter()
+            for i in range(count):
+                repository.save_transaction(dict(transaction, description=f"저녁 식사 {i}"))
+            timings['save_transaction'] = count / (time.perf_counter() - start)
+            
+            start = time.perf_counter()
+            for _ in range(20):
+                repository.load_transactions()
+            timings['load_transactions'] = 20 / (time.perf_counter() - start)
+            
+            start = time.perf_counter()
+            for i in range(count):
+                repository.save_settlement(f"정산 {i}", '2025-03-31', 30000.0, 3, settlement_data)
+            timings['save_settlement'] = count / (time.perf_counter() - start)
+            
+            start = time.perf_counter()
+            for _ in range(20):
+                repository.search('저녁')
+            timings['search'] = 20 / (time.perf_counter() - start)
+            
+            if isinstance(repository, InMemoryRepository) and repository.snapshot_path:
+                start = time.perf_counter()
+                repository.flush()
+                timings['flush'] = 1 / (time.perf_counter() - start)
+            results[name] = timings
+    return results
+
+# 설정(SETTLEMENT_STORAGE)에 맞는 저장소 (프로세스당 하나를 모든 세션이 공유)
+@st.cache_resource
+def get_repository():
+    if STORAGE_BACKEND == 'memory':
+        return InMemoryRepository(MEMORY_SNAPSHOT_PATH)
+    return SQLiteRepository(DB_PATH)
+
+# 업로드 처리용 작업자 풀 (모든 세션이 공유)
+@st.cache_resource
+def get_upload_executor():
+    return ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+def _strip_and_downscale(path):
+    """EXIF 회전 정보를 반영한 뒤 EXIF 없이 최대 크기 이내로 축소해 다시 저장"""
+    with Image.open(path) as img:
+        image_format = img.format
+        processed = ImageOps.exif_transpose(img)
+        processed.thumbnail((UPLOAD_MAX_DIMENSION, UPLOAD_MAX_DIMENSION))
+        processed.load()
+    save_options = {'quality': 90} if image_format == 'JPEG' else {}
+    processed.save(path, format=image_format, **save_options)
+
+def process_upload(uploaded_file, ext):
+    """업로드 파일을 청크 단위로 기록하면서 해시를 계산하고, 내용 해시 기반 경로로 저장"""
+    os.makedirs(ATTACHMENT_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    tmp_path = os.path.join(ATTACHMENT_DIR, f".upload_{uuid.uuid4().hex}.part")
+    try:
+        uploaded_file.seek(0)
+        with open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: uploaded_file.read(UPLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f.write(chunk)
+        
+        # 같은 사진은 한 번만 저장
+        final_path = os.path.join(ATTACHMENT_DIR, f"settlement_{digest.hexdigest()}{ext.lower()}")
+        if os.path.exists(final_path):
+            try:
+                os.utime(final_path)  # 정리(GC) 유예 시간 갱신
+                return final_path
+            except FileNotFoundError:
+                pass  # 그 사이 정리(GC)로 격리되었으면 다시 저장
+        _strip_and_downscale(tmp_path)
+        os.replace(tmp_path, final_path)
+        return final_path
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def enqueue_uploads(uploaded_files):
+    """업로드 파일별 처리 작업을 작업자 풀에 한 번만 등록하고 {file_id: future} 반환"""
+    pending = st.session_state.get('upload_futures', {})
+    futures = {}
+    for uploaded_file in uploaded_files:
+        future = pending.get(uploaded_file.file_id)
+        if future is None:
+            ext = os.path.splitext(uploaded_file.name)[-1]
+            future = get_upload_executor().submit(process_upload, uploaded_file, ext)
+        futures[uploaded_file.file_id] = future
+    st.session_state.upload_futures = futures
+    return futures
+
+def show_upload_progress(upload_futures, refreshing=False):
+    """사진 처리 진행률 표시 (refreshing이면 모두 끝났을 때 앱 전체를 다시 실행해 자동 갱신 중단)"""
+    done_count = sum(future.done() for future in upload_futures.values())
+    st.progress(done_count / len(upload_futures), text=f"사진 처리 {done_count}/{len(upload_futures)}")
+    if refreshing and done_count == len(upload_futures):
+        st.rerun()
+
+def split_image_paths(image_path):
+    """콤마로 구분해 저장된 첨부 사진 경로 목록"""
+    if not image_path:
+        return []
+    return [p.strip() for p in str(image_path).split(',') if p.strip()]
+
+# 정산 기록이 참조하는 첨부 사진 경로 (저장된 그대로)
+def load_attachment_paths(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("SELECT image_path FROM settlements WHERE image_path IS NOT NULL AND image_path != ''")
+    rows = c.fetchall()
     conn.close()
+    return sorted({p for row in rows for p in split_image_paths(row[0])})
+
+# 정산 기록(보관 DB 포함)이 참조하는 첨부 사진 경로 (정규화된 절대 경로)
+def load_referenced_attachments():
+    return {os.path.abspath(p) for p in get_repository().load_attachment_paths()}
+
+def _attachment_candidates(include_legacy=False):
+    """정리 대상이 될 수 있는 파일 경로, 이름순
+
+    기본은 첨부 폴더만 검사하고, include_legacy면 이전 버전이 작업 폴더에 저장한 사진(LEGACY_ATTACHMENT_PATTERN)도 포함한다.
+    작업 폴더에는 저장소에 포함된 파일도 있을 수 있으므로 명령행에서 명시적으로 요청할 때만 사용한다.
+    """
+    candidates = []
+    if os.path.isdir(ATTACHMENT_DIR):
+        with os.scandir(ATTACHMENT_DIR) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                is_attachment = entry.name.startswith('settlement_') and entry.name.lower().endswith(ATTACHMENT_EXTENSIONS)
+                is_partial_upload = entry.name.startswith('.upload_')
+                if is_attachment or is_partial_upload:
+                    candidates.append(os.path.abspath(entry.path))
+    if include_legacy and os.path.abspath(ATTACHMENT_DIR) != os.path.abspath('.'):
+        with os.scandir('.') as entries:
+            for entry in entries:
+                if entry.is_file() and LEGACY_ATTACHMENT_PATTERN.fullmatch(entry.name):
+                    candidates.append(os.path.abspath(entry.path))
+    return sorted(candidates)
+
+def _gc_cursor_path():
+    return os.path.join(ATTACHMENT_DIR, '.gc_cursor')
+
+def load_gc_cursor():
+    """이어서 정리할 위치 (마지막으로 검사한 파일 경로, 없으면 None)"""
+    try:
+        with open(_gc_cursor_path(), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def save_gc_cursor(cursor):
+    if cursor is None:
+        if os.path.exists(_gc_cursor_path()):
+            os.remove(_gc_cursor_path())
+        return
+    os.makedirs(ATTACHMENT_DIR, exist_ok=True)
+    with open(_gc_cursor_path(), 'w', encoding='utf-8') as f:
+        f.write(cursor)
+
+def collect_attachment_garbage(grace_hours=ATTACHMENT_GC_GRACE_HOURS, delete=False,
+                               batch_size=ATTACHMENT_GC_BATCH_SIZE, start_after=None,
+                               referenced=None, candidates=None, include_legacy=False):
+    """어떤 정산도 참조하지 않는 첨부 사진을 격리 폴더로 옮기거나(delete=False) 삭제
+
+    한 번에 batch_size개 파일만 검사하며, 결과의 next_cursor를 start_after로 넘겨 이어서 실행한다.
+    next_cursor가 None이면 전체 검사가 끝난 것이다.
+    여러 묶음을 연달아 처리할 때는 referenced(참조 경로 집합)와 candidates(정렬된 후보 목록)를 한 번만 구해 넘긴다.
+    """
+    if referenced is None:
+        referenced = load_referenced_attachments()
+    if candidates is None:
+        candidates = _attachment_candidates(include_legacy)
+    start = 0 if start_after is None else bisect.bisect_right(candidates, start_after)
+    batch = candidates[start:start + batch_size]
+    cutoff = time.time() - grace_hours * 3600
+    quarantine_dir = os.path.join(ATTACHMENT_DIR, '.quarantine')
+    
+    report = {'scanned': len(batch), 'removed': [], 'removed_bytes': 0,
+              'next_cursor': batch[-1] if start + batch_size < len(candidates) else None}
+    for path in batch:
+        if path in referenced:
+            continue
+        try:
+            stat = os.stat(path)
+            if stat.st_mtime > cutoff:
+                continue  # 업로드 중이거나 아직 저장되지 않은 정산의 사진일 수 있음
+            if delete:
+                os.remove(path)
+            else:
+                os.makedirs(quarantine_dir, exist_ok=True)
+                shutil.move(path, os.path.join(quarantine_dir, os.path.basename(path)))
+        except FileNotFoundError:
+            continue  # 다른 작업이 먼저 정리함
+        report['removed'].append(path)
+        report['removed_bytes'] += stat.st_size
+    return report
+
+def run_attachment_gc(delete=False, grace_hours=ATTACHMENT_GC_GRACE_HOURS, batch_size=ATTACHMENT_GC_BATCH_SIZE,
+                      max_batches=ATTACHMENT_GC_BATCHES_PER_RUN, resume=True, include_legacy=False):
+    """첨부 사진을 batch_size씩 나누어 최대 max_batches 묶음까지 정리하고 합계 반환
+
+    resume이면 저장된 위치부터 이어서 검사하고, 끝나지 않았으면 다음 실행을 위해 위치를 저장한다.
+    max_batches가 None이면 끝까지 검사한다. 결과의 finished가 False면 다음 실행에서 이어진다.
+    include_legacy는 _attachment_candidates 참고.
+    """
+    referenced = load_referenced_attachments()
+    candidates = _attachment_candidates(include_legacy)
+    total = {'scanned': 0, 'removed': [], 'removed_bytes': 0, 'finished': False}
+    cursor = load_gc_cursor() if resume else None
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        report = collect_attachment_garbage(grace_hours=grace_hours, delete=delete, batch_size=batch_size,
+                                            start_after=cursor, referenced=referenced, candidates=candidates)
+        batches += 1
+        total['scanned'] += report['scanned']
+        total['removed'] += report['removed']
+        total['removed_bytes'] += report['removed_bytes']
+        cursor = report['next_cursor']
+        if cursor is None:
+            total['finished'] = True
+            break
+    if resume:
+        save_gc_cursor(cursor)  # 처음부터 검사한 실행은 자동 정리의 진행 위치를 건드리지 않음
+    return total
+
+# 정산별 첨부 사진 디스크 사용량 (보관 DB 포함, 여러 정산이 같은 사진을 쓰면 각각에 포함, ledger_id가 None이면 모든 장부)
+def get_attachment_disk_usage(ledger_id=None):
+    repository = get_repository()
+    ledger_ids = [ledger['id'] for ledger in repository.load_ledgers()] if ledger_id is None else [ledger_id]
+    archive_years = repository.list_archive_years()
+    settlements = [s for lid in ledger_ids for s in repository.load_settlements(archive_years, ledger_id=lid)]
+    usage = []
+    for settlement in settlements:
+        if not settlement['image_path']:
+            continue
+        sizes = [os.path.getsize(p) for p in split_image_paths(settlement['image_path']) if os.path.exists(p)]
+        usage.append({'id': settlement['id'], 'name': settlement['name'], 'date': settlement['date'],
+                      'archive_year': settlement['archive_year'], 'file_count': len(sizes), 'bytes': sum(sizes)})
+    usage.sort(key=lambda item: item['bytes'], reverse=True)
+    return usage
+
+def _run_periodically(interval_seconds, job):
+    while True:
+        time.sleep(interval_seconds)
+        try:
+            job()
+        except Exception as e:  # 백그라운드 작업 실패로 스레드가 죽지 않도록
+            print(f"[{threading.current_thread().name}] 작업 실패: {e}", file=sys.stderr)
+
+# 실행 중에도 안전한 DB 백업 (sqlite3 온라인 백업 API, pages_per_step 페이지씩 복사)
+def backup_database(dest_path, pages_per_step=BACKUP_PAGES_PER_STEP, source_path=DB_PATH):
+    src = sqlite3.connect(source_path)
+    dst = sqlite3.connect(dest_path)
+    try:
+        src.backup(dst, pages=pages_per_step, sleep=BACKUP_STEP_SLEEP)
+    finally:
+        dst.close()
+        src.close()
+
+def _is_safe_relative_path(path):
+    return not os.path.isabs(path) and '..' not in os.path.normpath(path).split(os.sep)
+
+def create_snapshot(pages_per_step=BACKUP_PAGES_PER_STEP, retention=BACKUP_RETENTION):
+    """DB, 연도별 보관 DB, 첨부 사진을 버전 정보가 담긴 zip 스냅샷으로 저장하고 오래된 스냅샷 정리 (retention=None이면 정리 안 함)"""
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    snapshot_path = os.path.join(BACKUP_DIR, f"snapshot_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.zip")
+    tmp_zip_path = snapshot_path + ".part"
+    # zip 안의 DB 이름 -> 백업 사본 경로
+    databases = {'settlement.db': snapshot_path + ".db.part"}
+    databases.update({f"archive/settlement_{year}.db": f"{snapshot_path}.{year}.db.part" for year in list_archive_years()})
+    sources = {'settlement.db': DB_PATH}
+    sources.update({f"archive/settlement_{year}.db": archive_db_path(year) for year in list_archive_years()})
+    try:
+        attachments = set()
+        for name, tmp_db_path in databases.items():
+            backup_database(tmp_db_path, pages_per_step, sources[name])
+            # 백업 시점의 DB가 참조하는 사진만 포함
+            attachments.update(p for p in load_attachment_paths(tmp_db_path) if _is_safe_relative_path(p) and os.path.exists(p))
+        attachments = sorted(attachments)
+        
+        manifest = {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'created_at': datetime.now().isoformat(),
+            'database': 'settlement.db',
+            'archives': [name for name in databases if name != 'settlement.db'],
+            'attachments': attachments
+        }
+        with zipfile.ZipFile(tmp_zip_path, 'w') as zf:
+            for name, tmp_db_path in databases.items():
+                zf.write(tmp_db_path, name, compress_type=zipfile.ZIP_DEFLATED)
+            for path in attachments:
+                zf.write(path, f"files/{path}", compress_type=zipfile.ZIP_STORED)  # 사진은 이미 압축됨
+            zf.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+        os.replace(tmp_zip_path, snapshot_path)
+    finally:
+        for path in [tmp_zip_path, *databases.values()]:
+            if os.path.exists(path):
+                os.remove(path)
+    
+    if retention is not None:
+        rotate_snapshots(retention)
+    return snapshot_path
+
+def list_snapshots():
+    """저장된 스냅샷 목록 (최신순)"""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    names = sorted((name for name in os.listdir(BACKUP_DIR) if name.startswith('snapshot_') and name.endswith('.zip')), reverse=True)
+    return [{'name': name, 'path': os.path.join(BACKUP_DIR, name), 'bytes': os.path.getsize(os.path.join(BACKUP_DIR, name))}
+            for name in names]
+
+def rotate_snapshots(retention=BACKUP_RETENTION):
+    """최신 retention개만 남기고 오래된 스냅샷 삭제"""
+    removed = []
+    for snapshot in list_snapshots()[retention:]:
+        os.remove(snapshot['path'])
+        removed.append(snapshot['path'])
+    return removed
+
+def _read_snapshot_manifest(zf):
+    """스냅샷 zip 전체의 CRC와 manifest가 가리키는 항목을 확인하고 manifest 반환 (손상되었으면 ValueError)"""
+    try:
+        bad_member = zf.testzip()
+        manifest = json.loads(zf.read('manifest.json'))
+        required = [manifest['database'], *manifest.get('archives', []),
+                    *(f"files/{path}" for path in manifest['attachments'])]
+    except (zipfile.BadZipFile, zlib.error, KeyError, TypeError, ValueError, OSError, EOFError) as e:
+        raise ValueError(f"스냅샷 파일이 손상되었습니다: {e!r}") from e
+    if bad_member is not None:
+        raise ValueError(f"스냅샷 파일이 손상되었습니다: {bad_member}")
+    missing = set(required) - set(zf.namelist())
+    if missing:
+        raise ValueError(f"스냅샷에 없는 항목이 있습니다: {', '.join(sorted(missing))}")
+    if manifest.get('format_version', 0) > SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"지원하지 않는 스냅샷 버전입니다: {manifest.get('format_version')}")
+    return manifest
+
+def restore_snapshot(snapshot_path):
+    """무결성 검사를 통과한 스냅샷으로 DB와 보관 DB를 복원하고 없는 첨부 사진을 되살림 (복원 전 현재 상태를 스냅샷으로 보관)
+
+    스냅샷을 열 수 없거나 손상되었으면 아무것도 바꾸지 않고 ValueError를 낸다.
+    """
+    try:
+        zf = zipfile.ZipFile(snapshot_path)
+    except (zipfile.BadZipFile, OSError) as e:
+        raise ValueError(f"스냅샷 파일을 열 수 없습니다: {e}") from e
+    with zf:
+        manifest = _read_snapshot_manifest(zf)
+        
+        # zip 안의 DB 이름 -> 복원 위치
+        targets = {manifest['database']: DB_PATH}
+        for name in manifest.get('archives', []):
+            year = os.path.basename(name)[len('settlement_'):-len('.db')]
+            targets[name] = archive_db_path(year)
+        
+        tmp_paths = {name: os.path.join(BACKUP_DIR, f".restore_{uuid.uuid4().hex}.db") for name in targets}
+        try:
+            for name, tmp_db_path in tmp_paths.items():
+                with open(tmp_db_path, 'wb') as f:
+                    shutil.copyfileobj(zf.open(name), f)
+                conn = sqlite3.connect(tmp_db_path)
+                try:
+                    result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+                except sqlite3.DatabaseError as e:
+                    result = str(e)  # DB 파일이 아님
+                finally:
+                    conn.close()
+                if result != 'ok':
+                    raise ValueError(f"스냅샷 DB 무결성 검사 실패 ({name}): {result}")
+            
+            pre_restore_path = create_snapshot(retention=None)
+            
+            # 스냅샷에 없는 보관 DB는 제거해 운영 DB와 중복되지 않게 함
+            for year in list_archive_years():
+                if archive_db_path(year) not in targets.values():
+                    os.remove(archive_db_path(year))
+            
+            # 실행 중인 DB에 온라인 백업 API로 덮어쓰기
+            for name, tmp_db_path in tmp_paths.items():
+                os.makedirs(os.path.dirname(targets[name]) or '.', exist_ok=True)
+                backup_database(targets[name], source_path=tmp_db_path)
+        finally:
+            for tmp_db_path in tmp_paths.values():
+                if os.path.exists(tmp_db_path):
+                    os.remove(tmp_db_path)
+        
+        restored_files = []
+        for path in manifest['attachments']:
+            if _is_safe_relative_path(path) and not os.path.exists(path):
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                with open(path, 'wb') as f:
+                    shutil.copyfileobj(zf.open(f"files/{path}"), f)
+                restored_files.append(path)
+    
+    # 이전 버전 스냅샷이면 분석/검색 테이블 등 스키마 보완
+    init_db()
+    return {'pre_restore_snapshot': pre_restore_path, 'restored_files': restored_files}
+
+# 자동 백업 스레드 (프로세스당 한 번만 시작)
+@st.cache_resource
+def start_backup_scheduler(interval_hours):
+    thread = threading.Thread(target=_run_periodically, args=(interval_hours * 3600, create_snapshot),
+                              name="backup", daemon=True)
+    thread.start()
+    return thread
+
+# 첨부 사진 자동 정리 스레드 (프로세스당 한 번만 시작)
+@st.cache_resource
+def start_attachment_gc_scheduler(interval_hours):
+    thread = threading.Thread(target=_run_periodically, args=(interval_hours * 3600, run_attachment_gc),
+                              name="attachment-gc", daemon=True)
+    thread.start()
+    return thread
 
 # 세션 상태 초기화
 if 'transactions' not in st.session_state:
@@ -145,9 +1438,6 @@ if 'current_date' not in st.session_state:
 if 'editing_transaction' not in st.session_state:
     st.session_state.editing_transaction = None
 
-# DB 초기화
-init_db()
-
 def calculate_settlement():
     """전체 정산 계산 - 저장된 거래 내역 기반"""
     if not st.session_state.transactions:
@@ -186,6 +1476,12 @@ def calculate_settlement():
     
     return settlement_result
 
+def settlement_key(settlement):
+    """위젯 키용 정산 식별자 (보관 DB의 id는 해당 연도 안에서만 유일)"""
+    if settlement.get('archive_year') is None:
+        return str(settlement['id'])
+    return f"{settlement['archive_year']}_{settlement['id']}"
+
 def load_transaction_for_edit(transaction):
     """거래를 수정 모드로 로드"""
     st.session_state.editing_transaction = transaction
@@ -208,9 +1504,47 @@ def clear_inputs():
 def main():
     st.set_page_config(page_title="정산 시스템", layout="wide")
     
-    # DB에서 거래 내역 로드
-    if not st.session_state.transactions:
-        st.session_state.transactions = load_transactions_from_db()
+    # 저장소 (SETTLEMENT_STORAGE 설정에 따라 SQLite 또는 메모리)
+    repository = get_repository()
+    is_sqlite = isinstance(repository, SQLiteRepository)  # 보관/백업/재집계는 SQLite 저장소에서만 지원
+    
+    # 첨부 사진 자동 정리 시작
+    if ATTACHMENT_GC_INTERVAL_HOURS > 0:
+        start_attachment_gc_scheduler(ATTACHMENT_GC_INTERVAL_HOURS)
+    
+    # 자동 백업 시작
+    if is_sqlite and BACKUP_INTERVAL_HOURS > 0:
+        start_backup_scheduler(BACKUP_INTERVAL_HOURS)
+    
+    # 장부 선택 - 거래 입력/정산/기록/분석은 모두 선택한 장부 범위에서만 동작
+    ledgers = {ledger['id']: ledger['name'] for ledger in repository.load_ledgers()}
+    if 'pending_ledger_id' in st.session_state:
+        # 새로 만든 장부로 전환 (위젯 생성 전에만 값을 바꿀 수 있음)
+        st.session_state.ledger_id = st.session_state.pop('pending_ledger_id')
+        if 'new_ledger_name' in st.session_state:
+            del st.session_state.new_ledger_name
+    if st.session_state.get('ledger_id') not in ledgers:
+        st.session_state.ledger_id = DEFAULT_LEDGER_ID  # 복원 등으로 장부가 사라진 경우
+    with st.sidebar:
+        st.header("📒 장부")
+        st.selectbox("장부 선택", list(ledgers), format_func=ledgers.get, key="ledger_id")
+        new_ledger_name = st.text_input("새 장부 이름", key="new_ledger_name", placeholder="예: 제주 여행")
+        if st.button("➕ 장부 추가", key="create_ledger_btn", disabled=not new_ledger_name.strip(), use_container_width=True):
+            try:
+                st.session_state.pending_ledger_id = repository.create_ledger(new_ledger_name.strip())
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.rerun()
+    ledger_id = st.session_state.ledger_id
+    
+    # DB에서 거래 내역 로드 (장부가 바뀌면 입력 중이던 내용도 초기화)
+    if not st.session_state.transactions or st.session_state.get('transactions_ledger_id') != ledger_id:
+        if st.session_state.get('transactions_ledger_id') != ledger_id:
+            st.session_state.editing_transaction = None
+            st.session_state.members = []
+        st.session_state.transactions = repository.load_transactions(ledger_id)
+        st.session_state.transactions_ledger_id = ledger_id
     
     # 입력 필드 초기화 플래그 확인
     if st.session_state.get('should_clear_inputs', False):
@@ -231,11 +1565,7 @@ def main():
         # 거래 내역 초기화
         st.session_state.transactions = []
         # DB에서 거래 내역 삭제
-        conn = sqlite3.connect('settlement.db')
-        c = conn.cursor()
-        c.execute('DELETE FROM transactions')
-        conn.commit()
-        conn.close()
+        repository.clear_transactions(ledger_id)
         st.rerun()
     
     # CSS 스타일 추가 - 모바일 호환성 개선
@@ -401,12 +1731,12 @@ def main():
     st.markdown('<h1 class="main-header">💰 정산 시스템</h1>', unsafe_allow_html=True)
     
     # 탭 생성 (active_tab 세션 상태로 제어)
-    tab_labels = ["📝 거래 입력", "🧮 정산 결과", "📚 정산 기록"]
+    tab_labels = ["📝 거래 입력", "🧮 정산 결과", "📚 정산 기록", "📊 분석"]
     active_tab_idx = st.session_state.get('active_tab_idx', 0)
     tabs = st.tabs(tab_labels)
 
     # 탭 인덱스 매핑
-    TAB_INPUT, TAB_RESULT, TAB_HISTORY = 0, 1, 2
+    TAB_INPUT, TAB_RESULT, TAB_HISTORY, TAB_ANALYTICS = 0, 1, 2, 3
 
     # 탭 전환 함수
     def switch_to_tab(tab_idx):
@@ -547,22 +1877,22 @@ def main():
                             'member_amounts': modified_amounts,
                             'updated_at': datetime.now().isoformat()
                         })
-                        update_transaction_in_db(transaction)
+                        repository.update_transaction(transaction)
                         st.success("거래가 수정되었습니다!")
                         clear_inputs()
                         st.rerun()
                     else:
                         # 새 거래 추가
                         transaction = {
-                            'id': len(st.session_state.transactions) + 1,
                             'date': st.session_state.current_date,
                             'description': description,
                             'amount': amount,
                             'members': st.session_state.members.copy(),
                             'member_amounts': modified_amounts,
-                            'created_at': datetime.now().isoformat()
+                            'created_at': datetime.now().isoformat(),
+                            'ledger_id': ledger_id
                         }
-                        save_transaction_to_db(transaction)
+                        transaction['id'] = repository.save_transaction(transaction)
                         st.session_state.transactions.append(transaction)
                         st.success("거래가 저장되었습니다!")
                         # 입력 필드 초기화 플래그 설정
@@ -589,7 +1919,7 @@ def main():
                             load_transaction_for_edit(transaction)
                     with col2:
                         if st.button(f"🗑️ 삭제", key=f"delete_transaction_{transaction['id']}", use_container_width=True):
-                            delete_transaction_from_db(transaction['id'])
+                            repository.delete_transaction(transaction['id'])
                             st.session_state.transactions = [t for t in st.session_state.transactions if t['id'] != transaction['id']]
                             st.rerun()
     
@@ -628,32 +1958,42 @@ def main():
                 # 사진 첨부 (여러 장)
                 settlement_images = st.file_uploader("정산 관련 사진 첨부 (여러 장 가능)", type=["png", "jpg", "jpeg"], key="settlement_image", accept_multiple_files=True)
 
-                image_paths = []
-                if settlement_images:
-                    for img in settlement_images:
-                        ext = os.path.splitext(img.name)[-1]
-                        img_path = f"settlement_{settlement_name}_{settlement_date.strftime('%Y%m%d')}_{uuid.uuid4().hex}{ext}"
-                        with open(img_path, "wb") as f:
-                            f.write(img.read())
-                        image_paths.append(img_path)
-                image_paths_str = ",".join(image_paths) if image_paths else None
+                # 사진 처리는 작업자 풀에 맡기고 진행 상황만 표시
+                upload_futures = enqueue_uploads(settlement_images or [])
+                if upload_futures:
+                    # 처리 중인 사진이 있으면 진행률 부분만 주기적으로 다시 그림
+                    pending = not all(future.done() for future in upload_futures.values())
+                    st.fragment(show_upload_progress, run_every=UPLOAD_PROGRESS_REFRESH_SECONDS if pending else None)(
+                        upload_futures, refreshing=pending)
 
                 # 정산 결과 저장 버튼 클릭 시 기록 탭으로 이동
                 if st.button("💾 정산 결과 저장", type="primary", disabled=not settlement_name, use_container_width=True):
                     if settlement_name:
-                        save_settlement_to_db(
-                            settlement_name,
-                            settlement_date.strftime('%Y-%m-%d'),
-                            float(total_spent),
-                            len(settlement),
-                            settlement,
-                            image_paths_str
-                        )
-                        st.success(f"정산 결과가 저장되었습니다: {settlement_name}")
-                        st.session_state.should_clear_settlement_inputs = True
-                        st.session_state.should_clear_transactions = True
-                        st.session_state['active_tab_idx'] = TAB_HISTORY  # 기록 탭으로 이동
-                        st.rerun()
+                        # 진행 중인 사진 처리가 끝난 뒤 저장
+                        with st.spinner("사진 처리를 마무리하는 중..."):
+                            wait(upload_futures.values())
+                        try:
+                            image_paths = list(dict.fromkeys(future.result() for future in upload_futures.values()))
+                        except Exception as e:
+                            st.session_state.upload_futures = {}
+                            st.error(f"사진 처리 중 오류가 발생했습니다: {e}")
+                        else:
+                            image_paths_str = ",".join(image_paths) if image_paths else None
+                            repository.save_settlement(
+                                settlement_name,
+                                settlement_date.strftime('%Y-%m-%d'),
+                                float(total_spent),
+                                len(settlement),
+                                settlement,
+                                image_paths_str,
+                                ledger_id=ledger_id
+                            )
+                            st.success(f"정산 결과가 저장되었습니다: {settlement_name}")
+                            st.session_state.should_clear_settlement_inputs = True
+                            st.session_state.upload_futures = {}
+                            st.session_state.should_clear_transactions = True
+                            st.session_state['active_tab_idx'] = TAB_HISTORY  # 기록 탭으로 이동
+                            st.rerun()
                 
                 # 참여자별 상세 정산 - 모바일 친화적 카드
                 st.subheader("👥 참여자별 정산 내역")
@@ -715,7 +2055,41 @@ def main():
     with tabs[TAB_HISTORY]:
         st.header("📚 정산 기록")
         
-        settlements = load_settlements_from_db()
+        # 이전 연도 기록은 선택한 경우에만 보관 DB를 열어 조회/검색
+        archive_years = repository.list_archive_years()
+        selected_archive_years = []
+        if archive_years:
+            selected_archive_years = st.multiselect("🗃️ 보관된 이전 연도 기록 포함", archive_years, key="history_archive_years")
+        
+        # 전문 검색 - 정산 이름, 참여자, 거래 설명
+        search_query = st.text_input("🔍 정산 기록 검색", placeholder="예: 저녁, 참여자 이름", key="history_search")
+        if search_query.strip():
+            hits = repository.search(search_query, archive_years=selected_archive_years, ledger_id=ledger_id)
+            if not hits:
+                st.info("🔍 검색 결과가 없습니다.")
+            group = None
+            for hit in hits:
+                # 관련도 순위는 출처별로 따로 매겨지므로 묶음마다 제목을 붙여 구분
+                if (hit['kind'], hit['archive_year']) != group:
+                    group = (hit['kind'], hit['archive_year'])
+                    if hit['kind'] == 'transaction':
+                        st.markdown("**📝 진행 중인 거래**")
+                    elif hit['archive_year']:
+                        st.markdown(f"**🗃️ {hit['archive_year']}년 보관 정산**")
+                    else:
+                        st.markdown("**📚 정산 기록**")
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    kind_label = "📚 정산" if hit['kind'] == 'settlement' else "📝 진행 중인 거래"
+                    st.markdown(f"{kind_label} · {hit['date']} · **{hit['name']}** ({int(hit['amount']):,}원)  \n{hit['snippet']}")
+                with col2:
+                    if hit['kind'] == 'settlement':
+                        if st.button("📂 열기", key=f"open_search_hit_{settlement_key(hit)}", use_container_width=True):
+                            st.session_state.focus_settlement_key = settlement_key(hit)
+                            st.rerun()
+            st.markdown("---")
+        
+        settlements = repository.load_settlements(selected_archive_years, ledger_id=ledger_id)
         
         if not settlements:
             st.info("📝 저장된 정산 기록이 없습니다.")
@@ -723,7 +2097,10 @@ def main():
             st.subheader("📋 저장된 정산 목록")
             
             for i, settlement in enumerate(settlements):
-                with st.expander(f"📅 {settlement['date']} - {settlement['name']} ({int(settlement['total_amount']):,}원)"):
+                key = settlement_key(settlement)
+                is_focused = key == st.session_state.get('focus_settlement_key')
+                archive_icon = "🗃️ " if settlement['archive_year'] else ""
+                with st.expander(f"{archive_icon}📅 {settlement['date']} - {settlement['name']} ({int(settlement['total_amount']):,}원)", expanded=is_focused):
                     
                     # 정산 요약 정보
                     col1, col2 = st.columns(2)
@@ -781,15 +2158,8 @@ def main():
                                 """, unsafe_allow_html=True)
                             
                     # 정산 기록에서 expander를 펼쳤을 때만, 맨 하단에 첨부된 사진을 한 행에 3개씩 썸네일 그리드로 표시
-                    image_paths = []
-                    if settlement.get('image_path'):
-                        # 여러 장 지원: 콤마로 구분된 경로 저장 시 분리
-                        if ',' in str(settlement['image_path']):
-                            image_paths = [p.strip() for p in settlement['image_path'].split(',') if p.strip()]
-                        else:
-                            image_paths = [settlement['image_path']]
-                        # 실제 파일이 존재하는 것만 필터링
-                        image_paths = [p for p in image_paths if os.path.exists(p)]
+                    # 여러 장 지원: 콤마로 구분된 경로 중 실제 파일이 존재하는 것만 필터링
+                    image_paths = [p for p in split_image_paths(settlement.get('image_path')) if os.path.exists(p)]
                     if image_paths:
                         st.markdown('---')
                         st.markdown('**첨부된 사진**')
@@ -800,22 +2170,22 @@ def main():
                                     st.image(img_path, use_container_width=True)
 
                     # 삭제 확인 버튼 추가
-                    delete_key = f"delete_settlement_{settlement['id']}"
-                    confirm_key = f"confirm_delete_settlement_{settlement['id']}"
+                    delete_key = f"delete_settlement_{key}"
+                    confirm_key = f"confirm_delete_settlement_{key}"
                     
                     # 삭제 확인 상태 확인
                     if st.session_state.get(confirm_key, False):
                         st.warning(f"⚠️ 정말 '{settlement['name']}' 정산 기록을 삭제하시겠습니까?")
                         col1, col2 = st.columns(2)
                         with col1:
-                            if st.button("✅ 확인", key=f"confirm_{settlement['id']}", use_container_width=True):
-                                delete_settlement_from_db(settlement['id'])
+                            if st.button("✅ 확인", key=f"confirm_{key}", use_container_width=True):
+                                repository.delete_settlement(settlement['id'], settlement['archive_year'])
                                 st.success(f"정산 기록이 삭제되었습니다: {settlement['name']}")
                                 # 확인 상태 초기화
                                 st.session_state[confirm_key] = False
                                 st.rerun()
                         with col2:
-                            if st.button("❌ 취소", key=f"cancel_{settlement['id']}", use_container_width=True):
+                            if st.button("❌ 취소", key=f"cancel_{key}", use_container_width=True):
                                 # 확인 상태 초기화
                                 st.session_state[confirm_key] = False
                                 st.rerun()
@@ -824,7 +2194,201 @@ def main():
                             # 삭제 확인 상태 활성화
                             st.session_state[confirm_key] = True
                             st.rerun()
+        
+        # 오래된 정산을 연도별 보관 DB로 이동
+        if is_sqlite:
+            with st.expander("🗃️ 오래된 정산 보관"):
+                st.caption("기준 날짜 이전 정산을 연도별 보관 DB로 옮깁니다. 보관된 기록은 위에서 연도를 선택하면 조회·검색할 수 있습니다.")
+                archive_cutoff = st.date_input("보관 기준 날짜", value=datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS), key="archive_cutoff")
+                if st.button("🗃️ 보관하기", key="archive_settlements_btn", use_container_width=True):
+                    moved = archive_settlements(archive_cutoff.strftime('%Y-%m-%d'))
+                    if moved:
+                        st.success("보관 완료: " + ", ".join(f"{year}년 {count}건" for year, count in sorted(moved.items())))
+                    else:
+                        st.info("보관할 정산이 없습니다.")
+        
+        # 첨부파일 디스크 사용량 및 정리
+        with st.expander("💽 첨부 사진 관리"):
+            usage = get_attachment_disk_usage(ledger_id)
+            if usage:
+                st.write(f"**총 사용량**: {sum(item['bytes'] for item in usage) / (1024 * 1024):,.1f}MB")
+                usage_df = pd.DataFrame([{
+                    "정산": f"{item['date']} - {item['name']}",
+                    "보관": f"{item['archive_year']}년" if item['archive_year'] else "",
+                    "사진 수": item['file_count'],
+                    "용량(MB)": round(item['bytes'] / (1024 * 1024), 2)
+                } for item in usage])
+                st.dataframe(usage_df, hide_index=True, use_container_width=True)
+            else:
+                st.info("첨부된 사진이 없습니다.")
+            
+            st.caption(f"어떤 정산에도 연결되지 않은 사진 중 {ATTACHMENT_GC_GRACE_HOURS:g}시간 이상 지난 파일을 정리합니다.")
+            delete_orphans = st.checkbox("격리하지 않고 바로 삭제", key="gc_delete_orphans")
+            if st.button("🧹 사용하지 않는 사진 정리", key="run_attachment_gc_btn", use_container_width=True):
+                with st.spinner("첨부 사진을 검사하는 중..."):
+                    report = run_attachment_gc(delete=delete_orphans)
+                action = "삭제" if delete_orphans else "격리"
+                st.success(f"{report['scanned']}개 파일 검사, {len(report['removed'])}개 {action} "
+                           f"({report['removed_bytes'] / (1024 * 1024):,.1f}MB)")
+                if not report['finished']:
+                    st.info("아직 검사하지 않은 파일이 남았습니다. 다음 정리 때 이어서 검사합니다.")
+        
+        # 백업 및 복원
+        if is_sqlite:
+            with st.expander("🗄️ 백업 및 복원"):
+                st.caption(f"DB와 첨부 사진을 스냅샷으로 저장합니다. 최근 {BACKUP_RETENTION}개만 보관됩니다.")
+                if st.button("💾 지금 백업", key="create_snapshot_btn", use_container_width=True):
+                    with st.spinner("백업하는 중..."):
+                        snapshot_path = create_snapshot()
+                    st.success(f"백업이 저장되었습니다: {snapshot_path}")
+            
+                snapshots = list_snapshots()
+                if snapshots:
+                    selected = st.selectbox("복원할 스냅샷", snapshots, key="restore_snapshot_select",
+                                            format_func=lambda snap: f"{snap['name']} ({snap['bytes'] / (1024 * 1024):,.1f}MB)")
+                    confirm_restore = st.checkbox("⚠️ 현재 데이터를 스냅샷 내용으로 덮어씁니다", key="confirm_restore")
+                    if st.button("♻️ 복원", key="restore_snapshot_btn", disabled=not confirm_restore, use_container_width=True):
+                        try:
+                            with st.spinner("복원하는 중..."):
+                                result = restore_snapshot(selected['path'])
+                        except ValueError as e:
+                            st.error(str(e))
+                        else:
+                            st.session_state.transactions = []  # 다음 실행에서 다시 로드
+                            st.success(f"복원되었습니다. 복원 전 상태는 {result['pre_restore_snapshot']}에 보관했습니다.")
+                else:
+                    st.info("저장된 백업이 없습니다.")
+    
+    with tabs[TAB_ANALYTICS]:
+        st.header("📊 지출 분석")
+        
+        # 기간 필터 (기본: 최근 1년) - 분석 데이터는 월 단위로 집계되므로 선택한 날짜가 속한 월 전체가 포함됨
+        month_help = "월 단위로 집계합니다. 선택한 날짜가 속한 월 전체가 포함됩니다."
+        col1, col2 = st.columns(2)
+        with col1:
+            start_date = st.date_input("시작 월", value=datetime.now() - timedelta(days=365), key="analytics_start", help=month_help)
+        with col2:
+            end_date = st.date_input("종료 월", value=datetime.now(), key="analytics_end", help=month_help)
+        start_month, end_month = start_date.strftime('%Y-%m'), end_date.strftime('%Y-%m')
+        st.caption(f"집계 기간: {start_month} ~ {end_month} (월 단위)")
+        
+        monthly_summary = repository.load_monthly_settlement_summary(start_month, end_month, ledger_id)
+        member_spend = repository.load_member_monthly_spend(start_month, end_month, ledger_id)
+        
+        if not monthly_summary and not member_spend:
+            st.info("📝 선택한 기간에 정산 기록이 없습니다.")
+        else:
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown(f'<div class="metric-card"><h4>총 정산 금액</h4><h2>{int(sum(r["total_amount"] for r in monthly_summary)):,}원</h2></div>', unsafe_allow_html=True)
+            with col2:
+                st.markdown(f'<div class="metric-card"><h4>정산 건수</h4><h2>{sum(r["settlement_count"] for r in monthly_summary)}건</h2></div>', unsafe_allow_html=True)
+            
+            if member_spend:
+                spend_df = pd.DataFrame(member_spend)
+                
+                # 월별 멤버 지출 차트
+                st.subheader("📅 월별 멤버 지출")
+                st.bar_chart(spend_df.pivot_table(index='month', columns='member', values='total_amount', aggfunc='sum', fill_value=0))
+                
+                # 멤버별 합계 표
+                st.subheader("👥 멤버별 합계")
+                member_totals = (spend_df.groupby('member')
+                                 .agg(total_amount=('total_amount', 'sum'), settlement_count=('settlement_count', 'sum'))
+                                 .sort_values('total_amount', ascending=False)
+                                 .reset_index())
+                member_totals.columns = ["참여자", "총 지출", "월별 정산 참여 횟수 합계"]
+                st.dataframe(member_totals, hide_index=True, use_container_width=True)
+                st.caption("월별 정산 참여 횟수 합계: 여러 달에 걸친 거래가 있는 정산은 해당하는 달마다 한 번씩 셉니다.")
+        
+        if is_sqlite:
+            st.markdown("---")
+            if st.button("🔄 분석 데이터 다시 집계", key="rebuild_analytics_btn", use_container_width=True):
+                count = rebuild_analytics()
+                st.success(f"정산 {count}건으로 분석 데이터를 다시 집계했습니다.")
+
+
+# 명령행 관리 작업 (예: python settlement_app.py rebuild-analytics)
+def run_cli(argv):
+    parser = argparse.ArgumentParser(prog="settlement_app.py")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("rebuild-analytics", help="기존 정산 기록으로 분석 테이블 재집계")
+    bench_parser = subparsers.add_parser("bench-storage", help="저장소 구현별 처리량 비교")
+    bench_parser.add_argument("--count", type=int, default=2000, help="저장할 거래/정산 수")
+    subparsers.add_parser("rebuild-search", help="거래/정산 전문 검색 색인 재생성")
+    gc_parser = subparsers.add_parser("gc", help="정산에 연결되지 않은 첨부 사진 정리")
+    gc_parser.add_argument("--delete", action="store_true", help="격리하지 않고 바로 삭제")
+    gc_parser.add_argument("--grace-hours", type=float, default=ATTACHMENT_GC_GRACE_HOURS, help="최근 수정된 파일 보호 시간")
+    gc_parser.add_argument("--batch-size", type=int, default=ATTACHMENT_GC_BATCH_SIZE, help="한 번에 검사할 파일 수")
+    gc_parser.add_argument("--include-legacy", action="store_true",
+                           help="이전 버전이 작업 폴더에 저장한 사진(settlement_<이름>_<YYYYMMDD>_<uuid>.jpg 등)도 정리")
+    subparsers.add_parser("disk-usage", help="정산별 첨부 사진 디스크 사용량")
+    backup_parser = subparsers.add_parser("backup", help="DB와 첨부 사진 스냅샷 생성 (스케줄러/cron용)")
+    backup_parser.add_argument("--pages-per-step", type=int, default=BACKUP_PAGES_PER_STEP, help="한 단계에 복사할 DB 페이지 수")
+    backup_parser.add_argument("--retention", type=int, default=BACKUP_RETENTION, help="보관할 스냅샷 수")
+    restore_parser = subparsers.add_parser("restore", help="스냅샷으로 복원 (무결성 검사 후)")
+    restore_parser.add_argument("snapshot", help="스냅샷 zip 파일 경로")
+    subparsers.add_parser("list-backups", help="저장된 스냅샷 목록")
+    archive_parser = subparsers.add_parser("archive", help="오래된 정산을 연도별 보관 DB로 이동")
+    archive_parser.add_argument("--before", help="이 날짜(YYYY-MM-DD) 이전 정산 보관 (기본: SETTLEMENT_ARCHIVE_AFTER_DAYS일 전)")
+    args = parser.parse_args(argv)
+    if STORAGE_BACKEND == 'memory':
+        # 보관/백업/재집계는 SQLite DB 파일을 대상으로 하므로 메모리 저장소의 데이터에는 적용할 수 없음
+        if args.command in SQLITE_ONLY_COMMANDS:
+            parser.error(f"{args.command} 명령은 SQLite 저장소에서만 사용할 수 있습니다 (SETTLEMENT_STORAGE=memory)")
+    else:
+        init_db()
+    
+    if args.command == "rebuild-analytics":
+        count = rebuild_analytics()
+        print(f"정산 {count}건으로 분석 데이터를 다시 집계했습니다.")
+    elif args.command == "bench-storage":
+        results = benchmark_storage(args.count)
+        for name, timings in results.items():
+            print(name)
+            for operation, per_second in timings.items():
+                print(f"  {operation:20} {per_second:12,.0f} ops/s")
+    elif args.command == "rebuild-search":
+        rebuild_search_index()
+        print("검색 색인을 다시 만들었습니다.")
+    elif args.command == "gc":
+        report = run_attachment_gc(delete=args.delete, grace_hours=args.grace_hours, batch_size=args.batch_size,
+                                   max_batches=None, resume=False, include_legacy=args.include_legacy)
+        for path in report['removed']:
+            print(f"  {path}")
+        action = "삭제" if args.delete else "격리"
+        print(f"{report['scanned']}개 파일 검사, {len(report['removed'])}개 {action} ({report['removed_bytes']:,} bytes)")
+    elif args.command == "disk-usage":
+        usage = get_attachment_disk_usage()
+        for item in usage:
+            archived = f"  (보관 {item['archive_year']})" if item['archive_year'] else ""
+            print(f"{item['date']}  {item['name']}  {item['file_count']}장  {item['bytes']:,} bytes{archived}")
+        print(f"합계: {sum(item['bytes'] for item in usage):,} bytes")
+    elif args.command == "backup":
+        print(f"백업이 저장되었습니다: {create_snapshot(args.pages_per_step, args.retention)}")
+    elif args.command == "restore":
+        try:
+            result = restore_snapshot(args.snapshot)
+        except ValueError as e:
+            sys.exit(str(e))
+        print(f"복원되었습니다. 첨부 사진 {len(result['restored_files'])}개를 되살렸습니다.")
+        print(f"복원 전 상태: {result['pre_restore_snapshot']}")
+    elif args.command == "list-backups":
+        for snapshot in list_snapshots():
+            print(f"{snapshot['path']}  {snapshot['bytes']:,} bytes")
+    elif args.command == "archive":
+        cutoff_date = args.before or (datetime.now() - timedelta(days=ARCHIVE_AFTER_DAYS)).strftime('%Y-%m-%d')
+        moved = archive_settlements(cutoff_date)
+        for year, count in sorted(moved.items()):
+            print(f"{year}년: {count}건 -> {archive_db_path(year)}")
+        print(f"{cutoff_date} 이전 정산 {sum(moved.values())}건을 보관했습니다.")
+
+CLI_COMMANDS = ("rebuild-analytics", "bench-storage", "rebuild-search", "gc", "disk-usage", "backup", "restore", "list-backups", "archive")
+SQLITE_ONLY_COMMANDS = ("rebuild-analytics", "rebuild-search", "backup", "restore", "list-backups", "archive")
 
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS:
+        run_cli(sys.argv[1:])
+    else:
+        main() 
\ No newline at end of file
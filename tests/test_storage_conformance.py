@@ -0,0 +1,129 @@
+"""모든 저장소 구현(SettlementRepository)이 같은 규약을 지키는지 확인"""
+import pytest
+
+from settlement_app import DEFAULT_LEDGER_ID, InMemoryRepository, SQLiteRepository
+
+TRANSACTION = {'date': '2025-03-01', 'description': '저녁 식사', 'amount': 30000.0, 'members': ['철수', '영희'],
+               'member_amounts': [20000.0, 10000.0], 'created_at': '2025-03-01T19:00:00'}
+
+SETTLEMENT_DATA = {
+    '철수': {'settlement_amount': 20000.0, 'transactions': [
+        {'date': '2025-03-01', 'description': '저녁 회식', 'amount': 20000.0, 'total_amount': 30000.0}]},
+    '영희': {'settlement_amount': 10000.0, 'transactions': [
+        {'date': '2025-03-01', 'description': '저녁 회식', 'amount': 10000.0, 'total_amount': 30000.0}]}
+}
+
+
+@pytest.fixture(params=["sqlite", "memory", "memory+snapshot"])
+def repository(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteRepository(str(tmp_path / "settlement.db"), archives=False)
+    if request.param == "memory":
+        return InMemoryRepository()
+    return InMemoryRepository(str(tmp_path / "settlement_memory.jsonl"), snapshot_interval=0)
+
+
+def _hit_ids(hits, kind):
+    return [hit['id'] for hit in hits if hit['kind'] == kind]
+
+
+def test_transactions_round_trip_in_date_order(repository):
+    first_id = repository.save_transaction(TRANSACTION)
+    second_id = repository.save_transaction(dict(TRANSACTION, date='2025-03-02', description='점심'))
+    assert first_id != second_id
+    
+    loaded = repository.load_transactions()
+    assert [t['id'] for t in loaded] == [second_id, first_id]
+    assert loaded[1]['members'] == ['철수', '영희']
+    assert loaded[1]['member_amounts'] == [20000.0, 10000.0]
+
+
+def test_update_delete_and_clear_transactions(repository):
+    first_id = repository.save_transaction(TRANSACTION)
+    second_id = repository.save_transaction(dict(TRANSACTION, date='2025-03-02', description='점심'))
+    original = {t['id']: t for t in repository.load_transactions()}[first_id]
+    
+    repository.update_transaction(dict(original, description='저녁 회식', updated_at='2025-03-01T20:00:00'))
+    updated = {t['id']: t for t in repository.load_transactions()}[first_id]
+    assert updated['description'] == '저녁 회식'
+    assert updated['updated_at'] == '2025-03-01T20:00:00'
+    assert _hit_ids(repository.search('회식'), 'transaction') == [first_id]
+    
+    repository.delete_transaction(second_id)
+    assert [t['id'] for t in repository.load_transactions()] == [first_id]
+    repository.clear_transactions()
+    assert repository.load_transactions() == []
+
+
+def test_settlement_round_trip(repository):
+    settlement_id = repository.save_settlement('3월 정산', '2025-03-31', 30000.0, 2, SETTLEMENT_DATA,
+                                               'attachments/a.jpg,attachments/b.jpg')
+    settlements = repository.load_settlements()
+    assert [s['id'] for s in settlements] == [settlement_id]
+    assert settlements[0]['settlement_data'] == SETTLEMENT_DATA
+    assert settlements[0]['archive_year'] is None
+    assert repository.load_attachment_paths() == ['attachments/a.jpg', 'attachments/b.jpg']
+    assert _hit_ids(repository.search('회식'), 'settlement') == [settlement_id]
+    
+    repository.delete_settlement(settlement_id)
+    assert repository.load_settlements() == []
+    assert repository.load_attachment_paths() == []
+    assert _hit_ids(repository.search('회식'), 'settlement') == []
+
+
+def test_analytics_follow_settlements(repository):
+    settlement_id = repository.save_settlement('3월 정산', '2025-03-31', 30000.0, 2, SETTLEMENT_DATA)
+    assert repository.load_monthly_settlement_summary('2025-01', '2025-12') == [
+        {'month': '2025-03', 'settlement_count': 1, 'total_amount': 30000.0}]
+    assert repository.load_member_monthly_spend('2025-03', '2025-03') == [
+        {'month': '2025-03', 'member': '영희', 'total_amount': 10000.0, 'settlement_count': 1},
+        {'month': '2025-03', 'member': '철수', 'total_amount': 20000.0, 'settlement_count': 1}]
+    
+    repository.delete_settlement(settlement_id)
+    assert repository.load_monthly_settlement_summary('2025-01', '2025-12') == []
+    assert repository.load_member_monthly_spend('2025-01', '2025-12') == []
+
+
+def test_ledger_names_are_unique(repository):
+    assert [ledger['id'] for ledger in repository.load_ledgers()] == [DEFAULT_LEDGER_ID]
+    other = repository.create_ledger('여행')
+    assert [ledger['id'] for ledger in repository.load_ledgers()] == [DEFAULT_LEDGER_ID, other]
+    with pytest.raises(ValueError):
+        repository.create_ledger('여행')
+
+
+def test_ledgers_are_isolated(repository):
+    other = repository.create_ledger('여행')
+    kept_id = repository.save_transaction(TRANSACTION)
+    repository.save_transaction(dict(TRANSACTION, ledger_id=other))
+    repository.clear_transactions(other)
+    assert [t['id'] for t in repository.load_transactions()] == [kept_id]
+    assert repository.load_transactions(other) == []
+    
+    other_settlement = repository.save_settlement('여행 정산', '2025-03-31', 30000.0, 2, SETTLEMENT_DATA, ledger_id=other)
+    assert repository.load_settlements() == []
+    assert [s['id'] for s in repository.load_settlements(ledger_id=other)] == [other_settlement]
+    assert _hit_ids(repository.search('회식'), 'settlement') == []
+    assert _hit_ids(repository.search('회식', ledger_id=other), 'settlement') == [other_settlement]
+    assert repository.load_monthly_settlement_summary('2025-01', '2025-12') == []
+    assert repository.load_monthly_settlement_summary('2025-01', '2025-12', ledger_id=other) == [
+        {'month': '2025-03', 'settlement_count': 1, 'total_amount': 30000.0}]
+
+
+def test_memory_snapshot_survives_torn_tail_and_compaction(tmp_path):
+    path = str(tmp_path / "settlement_memory.jsonl")
+    repository = InMemoryRepository(path, snapshot_interval=0)
+    kept_id = repository.save_transaction(TRANSACTION)
+    deleted_id = repository.save_transaction(TRANSACTION)
+    repository.delete_transaction(deleted_id)
+    repository.flush()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "put_tran')  # 기록 중에 죽은 경우
+    
+    reopened = InMemoryRepository(path, snapshot_interval=0)
+    assert [t['id'] for t in reopened.load_transactions()] == [kept_id]
+    
+    reopened.compact()
+    compacted = InMemoryRepository(path, snapshot_interval=0)
+    assert [t['id'] for t in compacted.load_transactions()] == [kept_id]
+    assert compacted.save_transaction(TRANSACTION) > deleted_id  # 삭제된 id를 다시 쓰지 않음